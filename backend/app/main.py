@@ -1,15 +1,22 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 from app.services.db_service import db_service
-from app.services.generator_service import generator_service
-from app.models import Base, DatabaseConfig, RedisConfig, ESConfig, Template, TemplateGroup, LLMConfig, engine, get_db, init_db
+from app.services.generator_service import STREAM_CHUNK_SIZE, StreamingFileWriter, generator_service
+from app.services.output_cache import OUTPUT_CACHE_MAX_ENTRY_BYTES
+from app.services.snapshot_service import snapshot_service
+from app.services.llm_service import add_usage, llm_service
+from app.services.job_service import FINISHED_STATUSES, JOB_POLL_INTERVAL, job_service, job_to_dict
+from app.models import Base, DatabaseConfig, RedisConfig, ESConfig, Template, TemplateGroup, LLMConfig, SessionLocal, engine, get_db, init_db
 import uvicorn
 import json
 import asyncio
+from collections import deque
+import os
+import time
 
 # Initialize DB
 init_db()
@@ -31,9 +38,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def warm_up_templates():
+    # Optionally precompile every template so the first generate run is warm
+    if os.getenv("OMNIGEN_TEMPLATE_WARMUP", "").lower() not in ("1", "true", "yes"):
+        return
+    db = SessionLocal()
+    try:
+        result = generator_service.warm_up(db.query(Template).all())
+        print(f"Template warm-up compiled {result['compiled']} templates, {len(result['errors'])} errors")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def recover_generation_jobs():
+    # Jobs left behind by a dead worker become resumable, now and periodically
+    job_service.start()
+
+@app.on_event("shutdown")
+def dispose_engines():
+    # Close pooled connections to the inspected data sources
+    job_service.shutdown()
+    db_service.executor.shutdown()
+    db_service.engines.dispose()
+    generator_service.shutdown()
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    # Async LLM clients are closed on the event loop that owns their connections
+    await llm_service.shutdown()
+
+# How often a streaming endpoint polls for a client disconnect (seconds)
+DISCONNECT_CHECK_INTERVAL = 0.25
+# LLM files started ahead of the one being streamed, as a multiple of the pool's concurrency
+LLM_PREFETCH_FACTOR = 2
+# Chunks buffered per prefetched LLM file before its producer waits for the stream to catch up
+LLM_PREFETCH_QUEUE_SIZE = int(os.getenv("OMNIGEN_LLM_PREFETCH_QUEUE_SIZE", "256"))
+
+class ClientDisconnected(Exception):
+    pass
+
 # Pydantic Models
 class ConnectRequest(BaseModel):
     db_url: str
+    pattern: Optional[str] = None  # Name prefix or glob (e.g. "sys_*")
+    cursor: Optional[str] = None   # next_cursor of the previous page
+    limit: Optional[int] = None    # Page size, all tables when omitted
 
 class TableMetadataRequest(BaseModel):
     db_url: str
@@ -44,6 +94,13 @@ class GenerateRequest(BaseModel):
     selected_tables: List[str]
     template_group_id: int
     use_llm: bool = False
+    refresh_schema: bool = False  # Bypass the schema cache and re-reflect tables
+    parallel: bool = False  # Render the table x template matrix on the render pool (non-LLM only)
+    datasource_id: Optional[int] = None  # Saved DatabaseConfig for schema snapshots, matched by URL when omitted
+    incremental: bool = False  # Only regenerate tables whose schema changed since the last snapshot
+    bypass_llm_cache: bool = False  # Call the LLM even when a cached response exists (it is still stored)
+    batch_llm: bool = False  # Ask for all files of a table in one completion (LLM only)
+    llm_draft: bool = False  # Hybrid mode: the LLM edits each template's Jinja output instead of starting from scratch
 
 class DatabaseConfigCreate(BaseModel):
     name: str
@@ -121,6 +178,11 @@ class LLMConfigCreate(BaseModel):
     base_url: str
     api_key: Optional[str] = None
     model_name: str
+    max_concurrency: int = 4  # Max concurrent completions against this backend
+    pool_name: Optional[str] = None  # The active config's pool is load balanced as one backend
+    schema_format: str = "full"  # "compact" always sends the compact schema encoding
+    schema_token_budget: Optional[int] = None  # Table schemas are compacted to fit this many tokens
+    predicted_outputs: bool = False  # Send drafts as OpenAI predicted outputs (prediction=...)
     is_active: bool = False
 
 class LLMConfigResponse(BaseModel):
@@ -130,7 +192,13 @@ class LLMConfigResponse(BaseModel):
     base_url: str
     api_key: Optional[str]
     model_name: str
+    max_concurrency: Optional[int]
+    pool_name: Optional[str] = None
+    schema_format: Optional[str] = None
+    schema_token_budget: Optional[int] = None
+    predicted_outputs: Optional[bool] = None
     is_active: bool
+    stats: Optional[Dict[str, Any]] = None  # Routing stats: in_flight, latency_ms, healthy, ...
     
     class Config:
         from_attributes = True
@@ -185,10 +253,20 @@ async def delete_template_group(id: int, db: Session = Depends(get_db)):
     db_group = db.query(TemplateGroup).filter(TemplateGroup.id == id).first()
     if not db_group:
         raise HTTPException(status_code=404, detail="Group not found")
+    template_ids = [t.id for t in db_group.templates]
     db.delete(db_group)
     db.commit()
+    for template_id in template_ids:
+        generator_service.invalidate_template(template_id)
     return {"ok": True}
 
+@app.post("/api/template-groups/{id}/warmup")
+async def warm_up_template_group(id: int, db: Session = Depends(get_db)):
+    db_group = db.query(TemplateGroup).filter(TemplateGroup.id == id).first()
+    if not db_group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return generator_service.warm_up(db_group.templates)
+
 # Template API
 @app.get("/api/templates/{id}")
 async def get_template_content(id: int, db: Session = Depends(get_db)):
@@ -233,6 +311,7 @@ async def update_template(id: int, tmpl: TemplateCreate, db: Session = Depends(g
         t.display_name = tmpl.display_name
         t.prompt = tmpl.prompt
         db.commit()
+        generator_service.invalidate_template(id)
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -249,105 +328,310 @@ async def delete_template(id: int, db: Session = Depends(get_db)):
 
 @app.post("/api/connect")
 async def connect_db(request: ConnectRequest):
+    if request.limit is not None and request.limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
     try:
-        tables = db_service.get_tables(request.db_url)
-        return {"tables": tables}
+        return await db_service.alist_tables(request.db_url, request.pattern, request.cursor, request.limit)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/connect/stream")
+async def connect_db_stream(request: ConnectRequest):
+    async def event_stream():
+        try:
+            async for event in db_service.astream_tables(request.db_url, request.pattern):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @app.post("/api/table-metadata")
 async def get_table_metadata(request: TableMetadataRequest):
     try:
-        schema = db_service.get_table_schema(request.db_url, request.table_name)
+        schema = await db_service.aget_table_schema(request.db_url, request.table_name)
         return schema
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/api/engines")
+async def get_engine_stats():
+    # Hit/miss counters and pool status of the pooled data source engines
+    return db_service.engines.stats()
+
+@app.get("/api/schema-cache")
+async def get_schema_cache():
+    return db_service.schema_cache.stats()
+
+@app.delete("/api/schema-cache")
+async def purge_schema_cache(db_url: Optional[str] = None, table_name: Optional[str] = None):
+    # Without filters the whole cache is purged
+    removed = db_service.schema_cache.invalidate(db_url, table_name)
+    return {"ok": True, "removed": removed}
+
+@app.get("/api/llm-cache")
+async def get_llm_cache():
+    return await asyncio.to_thread(llm_service.response_cache.stats)
+
+@app.delete("/api/llm-cache")
+async def purge_llm_cache():
+    removed = await asyncio.to_thread(llm_service.response_cache.clear)
+    return {"ok": True, "removed": removed}
+
 @app.post("/api/generate")
 async def generate_code(request: GenerateRequest, db: Session = Depends(get_db)):
     results = []
+    warnings = []  # Path template errors, reported once per pattern
+    usage_totals = {}  # LLM tokens and timings of the run
     try:
-        # Get all templates in the group
-        group = db.query(TemplateGroup).filter(TemplateGroup.id == request.template_group_id).first()
+        # Get the group with all of its templates eagerly loaded
+        group = generator_service.get_group_with_templates(db, request.template_group_id)
         if not group:
             raise HTTPException(status_code=404, detail="Template Group not found")
         
         if not group.templates:
              raise HTTPException(status_code=400, detail="No templates in this group")
 
-        for table in request.selected_tables:
-            schema = db_service.get_table_schema(request.db_url, table)
-            
+        # Reflect all selected tables in bulk, off the event loop
+        schemas = await db_service.aget_table_schemas(
+            request.db_url, request.selected_tables, use_cache=not request.refresh_schema
+        )
+
+        # Diff against the stored snapshots; incremental runs skip unchanged tables
+        tables, table_changes, config_id = snapshot_service.select_tables(
+            db, request.db_url, request.selected_tables, schemas, request.datasource_id, request.incremental
+        )
+        skipped = [t for t in request.selected_tables if t not in tables]
+
+        # Render context for code and paths (e.g. {{ TableName|to_kebab_case }})
+        contexts = {}
+        for table in tables:
+            context = schemas[table].copy()
+            context['TableName'] = table
+            contexts[table] = context
+
+        # Files rendered by Jinja alone; in draft mode that includes templates without a prompt
+        llm_templates = [t for t in group.templates if generator_service.uses_llm(t, request.use_llm, request.llm_draft)]
+        jinja_templates = [t for t in group.templates if t not in llm_templates]
+
+        # Jinja renders are content addressed; a cache hit skips rendering
+        cached = {}
+        for table in tables:
+            for tmpl in jinja_templates:
+                key = generator_service.output_cache_key(tmpl, contexts[table])
+                cached[(table, tmpl.id)] = (key, generator_service.output_cache.get(key))
+
+        # Parallel mode renders the remaining units on the render pool
+        rendered = {}
+        if request.parallel:
+            pending = [
+                (table, tmpl) for table in tables for tmpl in jinja_templates
+                if cached[(table, tmpl.id)][1] is None
+            ]
+            futures = [generator_service.submit_render(tmpl, contexts[table]) for table, tmpl in pending]
+            units = await asyncio.gather(*[asyncio.wrap_future(f) for f in futures])
+            for (table, tmpl), unit in zip(pending, units):
+                rendered[(table, tmpl.id)] = unit
+
+        # LLM mode issues the completions concurrently, bounded per LLMConfig
+        if llm_templates and request.batch_llm:
+            batches = await gather_or_cancel([
+                timed_table_batch(db, llm_templates, contexts[table], not request.bypass_llm_cache, request.llm_draft)
+                for table in tables
+            ])
+            for table, units in zip(tables, batches):
+                for tmpl_id, unit in units.items():
+                    rendered[(table, tmpl_id)] = unit
+        elif llm_templates:
+            pending = [(table, tmpl) for table in tables for tmpl in llm_templates]
+            units = await gather_or_cancel([
+                timed_generation(db, tmpl, contexts[table], not request.bypass_llm_cache, request.llm_draft)
+                for table, tmpl in pending
+            ])
+            for (table, tmpl), unit in zip(pending, units):
+                rendered[(table, tmpl.id)] = unit
+
+        failed_tables = set()
+        for table in tables:
+            context = contexts[table]
+
             table_files = []
             for tmpl in group.templates:
-                code = generator_service.generate_code(db, tmpl.id, schema, request.use_llm)
-                # Resolve output path
-                # Simple variable substitution for output path (e.g. {{TableName}})
-                # We can reuse jinja environment to render path too
-                from jinja2 import Environment, DictLoader
-                
-                # We need a context for path rendering. Schema has 'TableName' usually?
-                # db_service.get_table_schema returns dict with 'columns', but maybe we add 'TableName'?
-                # Let's ensure schema has TableName
-                context = schema.copy()
-                context['TableName'] = table # Add table name if not present
-                
-                # Create env for path rendering (lightweight)
-                # Register filters for path as well (e.g. TableName|to_kebab_case)
-                path_env = Environment()
-                from app.services.generator_service import to_kebab_case, to_camel_case, to_pascal_case
-                path_env.filters['to_kebab_case'] = to_kebab_case
-                path_env.filters['to_camel_case'] = to_camel_case
-                path_env.filters['to_pascal_case'] = to_pascal_case
-                
-                # Render relative path
-                try:
-                    path_tmpl = path_env.from_string(tmpl.relative_path or "")
-                    rendered_relative_path = path_tmpl.render(context)
-                except:
-                    rendered_relative_path = tmpl.relative_path
-                
-                # Root path is usually static but let's allow rendering too if needed, or just prepend
-                root = tmpl.root_path or ""
-                if root and not root.endswith("/"):
-                    root += "/"
-                
-                full_path = root + rendered_relative_path
-
-                # Write to file
-                import os
+                key, code = cached.get((table, tmpl.id), (None, None))
+                elapsed_ms = 0.0
+                usage = None
+                if code is None:
+                    unit = rendered.get((table, tmpl.id))
+                    if unit is not None:
+                        if unit["error"]:
+                            raise Exception(unit["error"])
+                        code, elapsed_ms, usage = unit["code"], unit["elapsed_ms"], unit.get("usage")
+                    else:
+                        started = time.perf_counter()
+                        code = generator_service.generate_code(db, tmpl, context, request.use_llm, not request.bypass_llm_cache,
+                                                               request.llm_draft)
+                        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+                    if key:
+                        generator_service.output_cache.put(key, code)
+                    was_rendered = True
+                else:
+                    was_rendered = False
+
+                output = generator_service.resolve_output_path(tmpl, context)
+                full_path = output["full_path"]
+                rendered_relative_path = output["relative_path"]
+                if output["error"] and output["error"] not in warnings:
+                    warnings.append(output["error"])
+
+                # Write to file, skipped when the content on disk is identical
                 try:
-                    # Create directories if not exist
-                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                    # Write content
-                    with open(full_path, "w", encoding="utf-8") as f:
-                        f.write(code)
+                    status = generator_service.write_output(full_path, code)
                 except Exception as e:
-                    # Just log error but continue? Or fail? 
-                    # For now, let's append error to code output or similar
+                    # Just log error but continue
                     print(f"Failed to write file {full_path}: {e}")
-                    # code += f"\n\n// Error writing to file: {e}"
+                    status = "failed"
+                if status == "failed":
+                    failed_tables.add(table)
 
-                table_files.append({
+                file_entry = {
                     "template_name": tmpl.display_name or tmpl.name,
                     "path": full_path,
-                    "root_path": tmpl.root_path,
+                    "root_path": output["root_path"],
                     "relative_path": rendered_relative_path,
-                    "code": code
-                })
-            
-            results.append({"table": table, "files": table_files})
+                    "code": code,
+                    "elapsed_ms": elapsed_ms,
+                    "rendered": was_rendered,  # False when served from the output cache
+                    "status": status  # written / unchanged / failed
+                }
+                if request.use_llm:
+                    file_entry["usage"] = usage or {}  # Tokens (including cached_tokens) and timings
+                    add_usage(usage_totals, usage)
+                table_files.append(file_entry)
             
-        return {"results": results}
+            results.append({"table": table, "files": table_files, "schema_changes": table_changes.get(table)})
+
+        # Record what was generated as the baseline for the next incremental run;
+        # tables with a failed file are regenerated next time
+        if config_id is not None:
+            snapshot_service.save(db, config_id, {t: schemas[t] for t in tables if t not in failed_tables})
+
+        response = {"results": results, "warnings": warnings, "skipped": skipped}
+        if request.use_llm:
+            response["usage"] = usage_totals
+        return response
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+async def timed_generation(db: Session, tmpl: Template, context: Dict[str, Any], use_llm_cache: bool = True,
+                           use_draft: bool = False) -> Dict[str, Any]:
+    started = time.perf_counter()
+    usage = {}
+    code = await generator_service.agenerate_code(db, tmpl, context, use_llm_cache=use_llm_cache, usage=usage,
+                                               use_draft=use_draft)
+    return {"code": code, "error": None, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2), "usage": usage}
+
+async def timed_table_batch(db: Session, templates: List[Template], context: Dict[str, Any],
+                            use_llm_cache: bool = True, use_draft: bool = False) -> Dict[int, Dict[str, Any]]:
+    """Batched generation of a table's files, with per-file calls for whatever the batch missed."""
+    started = time.perf_counter()
+    usage = {}
+    codes = await generator_service.agenerate_table_batch(db, templates, context, use_llm_cache, usage, use_draft)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    units = {}
+    for tmpl_id, code in codes.items():
+        # The batch's tokens are reported on its first file
+        units[tmpl_id] = {"code": code, "error": None, "elapsed_ms": elapsed_ms,
+                          "usage": {"batched": True} if units else {**usage, "batched": True}}
+    missing = [tmpl for tmpl in templates if tmpl.id not in codes]
+    fallback = await gather_or_cancel([timed_generation(db, tmpl, context, use_llm_cache, use_draft) for tmpl in missing])
+    units.update({tmpl.id: unit for tmpl, unit in zip(missing, fallback)})
+    return units
+
+async def gather_or_cancel(coros: List[Any]) -> List[Any]:
+    """asyncio.gather that cancels the remaining work once one of them fails."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+async def prefetch_llm_stream(db: Session, tmpl: Template, context: Dict[str, Any], queue: asyncio.Queue,
+                              use_llm_cache: bool = True, use_draft: bool = False):
+    """Runs one file's LLM stream in the background, buffering its chunks in order."""
+    usage = {}
+    try:
+        async for chunk in generator_service.agenerate_code_stream(db, tmpl, context, use_llm_cache, usage, use_draft):
+            await queue.put(("chunk", chunk))
+        await queue.put(("end", usage))
+    except Exception as e:
+        await queue.put(("error", e))
+
+async def prefetch_table_batch(db: Session, templates: List[Template], context: Dict[str, Any],
+                               queues: Dict[int, asyncio.Queue], use_llm_cache: bool = True, use_draft: bool = False):
+    """Batched variant of prefetch_llm_stream, feeding one queue per template."""
+    usage = {}
+    try:
+        codes = await generator_service.agenerate_table_batch(db, templates, context, use_llm_cache, usage, use_draft)
+    except Exception as e:
+        # Every file of the table waits on its queue, so each one gets the error
+        for tmpl in templates:
+            await queues[tmpl.id].put(("error", e))
+        return
+    # Files the batch missed are generated one by one while the parsed ones are queued
+    fallback = [
+        asyncio.ensure_future(prefetch_llm_stream(db, tmpl, context, queues[tmpl.id], use_llm_cache, use_draft))
+        for tmpl in templates if tmpl.id not in codes
+    ]
+    try:
+        for tmpl in templates:
+            code = codes.get(tmpl.id)
+            if code is None:
+                continue
+            for i in range(0, len(code), STREAM_CHUNK_SIZE):
+                await queues[tmpl.id].put(("chunk", code[i:i + STREAM_CHUNK_SIZE]))
+            # The batch's tokens are reported on its first file
+            await queues[tmpl.id].put(("end", {**usage, "batched": True}))
+            usage = {}
+        await asyncio.gather(*fallback)
+    finally:
+        for task in fallback:
+            task.cancel()
+
+async def drain_llm_stream(queue: asyncio.Queue, usage: Dict[str, Any]):
+    while True:
+        kind, value = await queue.get()
+        if kind == "end":
+            usage.update(value or {})
+            return
+        if kind == "error":
+            raise value
+        yield value
+
+async def iterate_stream(stream_gen):
+    for chunk in stream_gen:
+        yield chunk
+
 @app.post("/api/generate/stream")
-async def generate_code_stream(request: GenerateRequest, db: Session = Depends(get_db)):
+async def generate_code_stream(request: GenerateRequest, http_request: Request, db: Session = Depends(get_db)):
+    # What is in flight, so a disconnect can stop it and report what was abandoned
+    run = {"total": 0, "done": 0, "file": None, "chunks": 0, "stream_gen": None, "writer": None,
+           "futures": {}, "llm_tasks": [], "finished": False, "last_check": 0.0}
+
+    async def client_gone() -> bool:
+        # is_disconnected() is cheap but not free; check at most every DISCONNECT_CHECK_INTERVAL
+        now = time.monotonic()
+        if now - run["last_check"] < DISCONNECT_CHECK_INTERVAL:
+            return False
+        run["last_check"] = now
+        return await http_request.is_disconnected()
+
     async def event_stream():
+        usage_totals = {}  # LLM tokens and timings of the run
         try:
-            # Get all templates in the group
-            group = db.query(TemplateGroup).filter(TemplateGroup.id == request.template_group_id).first()
+            # Get the group with all of its templates eagerly loaded
+            group = generator_service.get_group_with_templates(db, request.template_group_id)
             if not group:
                 yield json.dumps({"type": "error", "message": "Template Group not found"}) + "\n"
                 return
@@ -356,36 +640,100 @@ async def generate_code_stream(request: GenerateRequest, db: Session = Depends(g
                  yield json.dumps({"type": "error", "message": "No templates in this group"}) + "\n"
                  return
 
-            total_files = len(request.selected_tables) * len(group.templates)
-            yield json.dumps({"type": "start", "total": total_files}) + "\n"
+            reported_path_errors = set()
+
+            # Reflect all selected tables in bulk, off the event loop
+            schemas = await db_service.aget_table_schemas(
+                request.db_url, request.selected_tables, use_cache=not request.refresh_schema
+            )
+
+            # Diff against the stored snapshots; incremental runs skip unchanged tables
+            tables, table_changes, config_id = snapshot_service.select_tables(
+                db, request.db_url, request.selected_tables, schemas, request.datasource_id, request.incremental
+            )
+            skipped = [t for t in request.selected_tables if t not in tables]
 
-            for table in request.selected_tables:
-                schema = db_service.get_table_schema(request.db_url, table)
-                
-                # Context setup (Same as normal generate)
-                context = schema.copy()
+            total_files = len(tables) * len(group.templates)
+            yield json.dumps({"type": "start", "total": total_files, "skipped": skipped}) + "\n"
+
+            contexts = {}
+            for table in tables:
+                context = schemas[table].copy()
                 context['TableName'] = table
-                
-                # Jinja Env for path rendering
-                from jinja2 import Environment
-                path_env = Environment()
-                from app.services.generator_service import to_kebab_case, to_camel_case, to_pascal_case
-                path_env.filters['to_kebab_case'] = to_kebab_case
-                path_env.filters['to_camel_case'] = to_camel_case
-                path_env.filters['to_pascal_case'] = to_pascal_case
+                contexts[table] = context
+
+            # Files rendered by Jinja alone; in draft mode that includes templates without a prompt
+            llm_templates = [t for t in group.templates if generator_service.uses_llm(t, request.use_llm, request.llm_draft)]
+            jinja_templates = [t for t in group.templates if t not in llm_templates]
+
+            # Jinja renders are content addressed; a cache hit skips rendering
+            cached = {}
+            for table in tables:
+                for tmpl in jinja_templates:
+                    key = generator_service.output_cache_key(tmpl, contexts[table])
+                    cached[(table, tmpl.id)] = (key, generator_service.output_cache.get(key))
+
+            # Parallel mode submits the remaining units up front and streams
+            # results in order as they complete
+            futures = run["futures"]
+            if request.parallel:
+                for table in tables:
+                    for tmpl in jinja_templates:
+                        if cached[(table, tmpl.id)][1] is None:
+                            futures[(table, tmpl.id)] = generator_service.submit_render(tmpl, contexts[table])
+
+            # LLM mode starts completions ahead of the file being streamed, in file
+            # order and up to a window of twice the pool's concurrency; the
+            # per-LLMConfig limit decides how many actually run, and the chunks
+            # are still emitted file by file
+            llm_streams = {}
+            llm_pending = deque()
+            if llm_templates:
+                for table in tables:
+                    if request.batch_llm:
+                        # Batched files arrive whole once the table's completion is parsed
+                        llm_pending.append((table, llm_templates))
+                    else:
+                        llm_pending.extend((table, [tmpl]) for tmpl in llm_templates)
+            llm_window = LLM_PREFETCH_FACTOR * max(1, llm_service.max_concurrency(db)) if llm_templates else 0
+
+            def prefetch_ahead():
+                # Called whenever a file is taken for streaming, to refill the window
+                run["llm_tasks"] = [task for task in run["llm_tasks"] if not task.done()]
+                while llm_pending and len(llm_streams) < llm_window:
+                    table, templates = llm_pending.popleft()
+                    queues = {tmpl.id: asyncio.Queue(LLM_PREFETCH_QUEUE_SIZE) for tmpl in templates}
+                    if request.batch_llm:
+                        task = prefetch_table_batch(
+                            db, templates, contexts[table], queues, not request.bypass_llm_cache, request.llm_draft
+                        )
+                    else:
+                        task = prefetch_llm_stream(
+                            db, templates[0], contexts[table], queues[templates[0].id],
+                            not request.bypass_llm_cache, request.llm_draft
+                        )
+                    run["llm_tasks"].append(asyncio.ensure_future(task))
+                    for tmpl in templates:
+                        llm_streams[(table, tmpl.id)] = queues[tmpl.id]
+
+            prefetch_ahead()
+            run["total"] = total_files
+
+            for table in tables:
+                context = contexts[table]
+                table_failed = False
 
                 for tmpl in group.templates:
+                    if await client_gone():
+                        raise ClientDisconnected()
+
                     # Resolve Path
-                    try:
-                        path_tmpl = path_env.from_string(tmpl.relative_path or "")
-                        rendered_relative_path = path_tmpl.render(context)
-                    except:
-                        rendered_relative_path = tmpl.relative_path
-                    
-                    root = tmpl.root_path or ""
-                    if root and not root.endswith("/"):
-                        root += "/"
-                    full_path = root + rendered_relative_path
+                    output = generator_service.resolve_output_path(tmpl, context)
+                    full_path = output["full_path"]
+                    rendered_relative_path = output["relative_path"]
+                    if output["error"] and output["error"] not in reported_path_errors:
+                        reported_path_errors.add(output["error"])
+                        yield json.dumps({"type": "error", "message": output["error"]}) + "\n"
 
                     # Notify File Start
                     yield json.dumps({
@@ -396,45 +744,222 @@ async def generate_code_stream(request: GenerateRequest, db: Session = Depends(g
                         "template": tmpl.display_name or tmpl.name
                     }) + "\n"
 
-                    # Generate Code Stream
-                    full_code_buffer = ""
-                    try:
-                        # We use a generator from generator_service
-                        # Note: We are inside an async function, but generator_service is synchronous generator.
-                        # Ideally we should run this in threadpool if it blocks, but LLM call inside is blocking.
-                        # For now, we iterate the sync generator.
-                        stream_gen = generator_service.generate_code_stream(db, tmpl.id, schema, request.use_llm)
-                        
-                        for chunk in stream_gen:
-                            if chunk:
-                                full_code_buffer += chunk
-                                yield json.dumps({"type": "chunk", "content": chunk}) + "\n"
-                                # Small sleep to let event loop breathe if needed, or just let it flow
-                                await asyncio.sleep(0) 
-
-                    except Exception as e:
-                        yield json.dumps({"type": "error", "message": str(e)}) + "\n"
-                        full_code_buffer = f"// Error generating code: {e}"
-
-                    # Write File (Side Effect)
-                    import os
+                    # Output is written incrementally as chunks arrive
+                    writer = None
                     try:
-                        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                        with open(full_path, "w", encoding="utf-8") as f:
-                            f.write(full_code_buffer)
+                        writer = StreamingFileWriter(full_path)
                     except Exception as e:
                         yield json.dumps({"type": "error", "message": f"Write failed: {e}"}) + "\n"
+                    run.update(file=full_path, chunks=0, writer=writer)
+
+                    # Generate Code Stream
+                    key, cached_code = cached.get((table, tmpl.id), (None, None))
+                    was_rendered = cached_code is None
+                    started = time.perf_counter()
+                    elapsed_ms = None
+                    usage = {}
+                    if cached_code is not None:
+                        elapsed_ms = 0.0
+                        for i in range(0, len(cached_code), STREAM_CHUNK_SIZE):
+                            chunk = cached_code[i:i + STREAM_CHUNK_SIZE]
+                            if writer:
+                                writer.write(chunk)
+                            yield json.dumps({"type": "chunk", "content": chunk}) + "\n"
+                    elif (table, tmpl.id) in futures:
+                        unit = await asyncio.wrap_future(futures.pop((table, tmpl.id)))
+                        elapsed_ms = unit["elapsed_ms"]  # Render time inside the pool worker
+                        if unit["error"]:
+                            table_failed = True
+                            yield json.dumps({"type": "error", "message": unit["error"]}) + "\n"
+                            code = f"// Error generating code: {unit['error']}"
+                        else:
+                            code = unit["code"]
+                            generator_service.output_cache.put(key, code)
+                            yield json.dumps({"type": "chunk", "content": code}) + "\n"
+                        if writer:
+                            writer.write(code)
+                    else:
+                        # Keep a copy of small outputs for the output cache
+                        parts = [] if key else None
+                        parts_size = 0
+                        try:
+                            if (table, tmpl.id) in llm_streams:
+                                chunks = drain_llm_stream(llm_streams.pop((table, tmpl.id)), usage)
+                                prefetch_ahead()
+                            else:
+                                # Jinja rendering is CPU bound and streamed in coalesced chunks
+                                stream_gen = generator_service.generate_code_stream(db, tmpl, context, False)
+                                run["stream_gen"] = stream_gen
+                                chunks = iterate_stream(stream_gen)
+
+                            async for chunk in chunks:
+                                if chunk:
+                                    run["chunks"] += 1
+                                    if await client_gone():
+                                        raise ClientDisconnected()
+                                    if writer:
+                                        writer.write(chunk)
+                                    if parts is not None:
+                                        parts_size += len(chunk)
+                                        parts = parts if parts_size <= OUTPUT_CACHE_MAX_ENTRY_BYTES else None
+                                        if parts is not None:
+                                            parts.append(chunk)
+                                    yield json.dumps({"type": "chunk", "content": chunk}) + "\n"
+                                    # Small sleep to let event loop breathe if needed, or just let it flow
+                                    await asyncio.sleep(0)
+
+                            run["stream_gen"] = None
+                            if parts is not None:
+                                generator_service.output_cache.put(key, "".join(parts))
+                        except ClientDisconnected:
+                            raise
+                        except Exception as e:
+                            run["stream_gen"] = None
+                            table_failed = True
+                            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+                            if writer:
+                                writer.reset(f"// Error generating code: {e}")
+
+                    # Swap the finished file in (Side Effect), unless it is unchanged
+                    status = "failed"
+                    run["writer"] = None
+                    if writer:
+                        try:
+                            status = writer.commit()
+                        except Exception as e:
+                            writer.abort()
+                            yield json.dumps({"type": "error", "message": f"Write failed: {e}"}) + "\n"
+                    if status == "failed":
+                        table_failed = True
 
                     # Notify File End
-                    yield json.dumps({"type": "file_end"}) + "\n"
-            
-            yield json.dumps({"type": "done"}) + "\n"
+                    if elapsed_ms is None:
+                        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+                    file_end = {
+                        "type": "file_end",
+                        "elapsed_ms": elapsed_ms,
+                        "rendered": was_rendered,
+                        "status": status
+                    }
+                    if request.use_llm:
+                        file_end["usage"] = usage  # Tokens, queue wait, TTFT, latency and tokens/s
+                        add_usage(usage_totals, usage)
+                    yield json.dumps(file_end) + "\n"
+                    run["done"] += 1
+                    run["file"] = None
+
+                # Record the table as the baseline for the next incremental run
+                if config_id is not None and not table_failed:
+                    snapshot_service.save(db, config_id, {table: schemas[table]})
 
+            run["finished"] = True
+            done = {"type": "done"}
+            if request.use_llm:
+                done["usage"] = usage_totals
+            yield json.dumps(done) + "\n"
+
+        except ClientDisconnected:
+            pass
         except Exception as e:
             yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+        finally:
+            # Runs on normal completion, on a detected disconnect and when the
+            # server cancels the response because the client went away
+            if not run["finished"]:
+                abandon_stream_run(run)
 
     return StreamingResponse(event_stream(), media_type="application/x-ndjson")
 
+def abandon_stream_run(run: Dict[str, Any]):
+    """Stops upstream work of an unfinished stream and logs what was abandoned."""
+    stream_gen = run.get("stream_gen")
+    if stream_gen is not None:
+        # Raises GeneratorExit inside the generator, which closes the LLM HTTP stream
+        stream_gen.close()
+    writer = run.get("writer")
+    if writer is not None:
+        writer.abort()
+    cancelled = sum(1 for f in run["futures"].values() if f.cancel())
+    cancelled += sum(1 for t in run["llm_tasks"] if t.cancel())
+    remaining = run["total"] - run["done"]
+    if remaining > 0:
+        detail = f"{cancelled} queued generations cancelled"
+        if run["file"]:
+            detail = f"{run['file']} stopped after {run['chunks']} chunks, " + detail
+        print(f"Generate stream stopped early: abandoned {remaining} of {run['total']} files ({detail})")
+
+# Generation Jobs API
+@app.post("/api/jobs/generate")
+async def create_generation_job(request: GenerateRequest, db: Session = Depends(get_db)):
+    group = db.query(TemplateGroup).filter(TemplateGroup.id == request.template_group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Template Group not found")
+    job = job_service.create_job(db, request.dict())
+    job_service.submit(job.id)
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/api/jobs")
+async def get_generation_jobs(limit: int = 50, db: Session = Depends(get_db)):
+    return [job_to_dict(j) for j in job_service.list_jobs(db, limit)]
+
+@app.get("/api/jobs/{job_id}")
+async def get_generation_job(job_id: str, db: Session = Depends(get_db)):
+    job = job_service.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_dict(job)
+
+@app.get("/api/jobs/{job_id}/files")
+async def get_generation_job_files(job_id: str, after_id: int = 0, db: Session = Depends(get_db)):
+    job, files = job_service.progress(db, job_id, after_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job": job, "files": files}
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str):
+    # NDJSON subscription: file events as they are recorded, progress on change,
+    # and a final done event once the job stops
+    async def event_stream():
+        last_file_id = 0
+        last_state = None
+        while True:
+            db = SessionLocal()
+            try:
+                job, files = job_service.progress(db, job_id, last_file_id)
+            finally:
+                db.close()
+            if job is None:
+                yield json.dumps({"type": "error", "message": "Job not found"}) + "\n"
+                return
+            for f in files:
+                last_file_id = f["id"]
+                yield json.dumps({"type": "file", **f}, default=str) + "\n"
+            state = (job["status"], job["total"], job["completed"], job["failed"])
+            if state != last_state:
+                last_state = state
+                yield json.dumps({"type": "progress", "job": job}, default=str) + "\n"
+            if job["status"] in FINISHED_STATUSES:
+                yield json.dumps({"type": "done", "status": job["status"]}) + "\n"
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_generation_job(job_id: str, db: Session = Depends(get_db)):
+    try:
+        return job_to_dict(job_service.cancel(db, job_id))
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/jobs/{job_id}/resume")
+async def resume_generation_job(job_id: str, db: Session = Depends(get_db)):
+    try:
+        return job_to_dict(job_service.resume(db, job_id))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Data Source API (Database)
 @app.post("/api/datasources/database", response_model=DatabaseConfigResponse)
 async def create_database_config(ds: DatabaseConfigCreate, db: Session = Depends(get_db)):
@@ -479,6 +1004,7 @@ async def delete_database_config(id: int, db: Session = Depends(get_db)):
     db_ds = db.query(DatabaseConfig).filter(DatabaseConfig.id == id).first()
     if not db_ds:
         raise HTTPException(status_code=404, detail="DatabaseConfig not found")
+    snapshot_service.delete_for_config(db, id)
     db.delete(db_ds)
     db.commit()
     return {"ok": True}
@@ -566,16 +1092,32 @@ async def create_llm_config(config: LLMConfigCreate, db: Session = Depends(get_d
         base_url=config.base_url,
         api_key=config.api_key,
         model_name=config.model_name,
+        max_concurrency=max(1, config.max_concurrency),
+        pool_name=config.pool_name or None,
+        schema_format=config.schema_format,
+        schema_token_budget=config.schema_token_budget or None,
+        predicted_outputs=1 if config.predicted_outputs else 0,
         is_active=1 if config.is_active else 0
     )
     db.add(db_config)
     db.commit()
     db.refresh(db_config)
+    llm_service.invalidate_config()
     return db_config
 
 @app.get("/api/llm", response_model=List[LLMConfigResponse])
 async def get_llm_configs(db: Session = Depends(get_db)):
-    return db.query(LLMConfig).all()
+    configs = []
+    for config in db.query(LLMConfig).all():
+        response = LLMConfigResponse.model_validate(config)
+        response.stats = llm_service.backend_stats(config.id)
+        configs.append(response)
+    return configs
+
+@app.post("/api/llm/health")
+async def check_llm_health(db: Session = Depends(get_db)):
+    # Probes every LLM config and updates its health
+    return await llm_service.check_health(db)
 
 @app.put("/api/llm/{id}", response_model=LLMConfigResponse)
 async def update_llm_config(id: int, config: LLMConfigCreate, db: Session = Depends(get_db)):
@@ -592,10 +1134,16 @@ async def update_llm_config(id: int, config: LLMConfigCreate, db: Session = Depe
     db_config.base_url = config.base_url
     db_config.api_key = config.api_key
     db_config.model_name = config.model_name
+    db_config.max_concurrency = max(1, config.max_concurrency)
+    db_config.pool_name = config.pool_name or None
+    db_config.schema_format = config.schema_format
+    db_config.schema_token_budget = config.schema_token_budget or None
+    db_config.predicted_outputs = 1 if config.predicted_outputs else 0
     db_config.is_active = 1 if config.is_active else 0
     
     db.commit()
     db.refresh(db_config)
+    llm_service.invalidate_config()
     return db_config
 
 @app.delete("/api/llm/{id}")
@@ -605,6 +1153,7 @@ async def delete_llm_config(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="LLM Config not found")
     db.delete(db_config)
     db.commit()
+    llm_service.invalidate_config()
     return {"ok": True}
 
 if __name__ == "__main__":
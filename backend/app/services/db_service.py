@@ -1,55 +1,641 @@
-from sqlalchemy import create_engine, inspect, text
-from typing import List, Dict, Any
+import asyncio
+import base64
+import copy
+import fnmatch
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import bindparam, create_engine, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.engine.reflection import ObjectKind
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+# Engine registry settings (overridable through the environment)
+ENGINE_REGISTRY_MAX_SIZE = int(os.getenv("OMNIGEN_ENGINE_MAX_SIZE", "16"))
+ENGINE_IDLE_TTL = float(os.getenv("OMNIGEN_ENGINE_IDLE_TTL", "600"))
+ENGINE_POOL_SIZE = int(os.getenv("OMNIGEN_ENGINE_POOL_SIZE", "5"))
+ENGINE_MAX_OVERFLOW = int(os.getenv("OMNIGEN_ENGINE_MAX_OVERFLOW", "5"))
+ENGINE_POOL_RECYCLE = int(os.getenv("OMNIGEN_ENGINE_POOL_RECYCLE", "1800"))
+
+# Schema cache settings
+SCHEMA_CACHE_TTL = float(os.getenv("OMNIGEN_SCHEMA_CACHE_TTL", "3600"))
+SCHEMA_CACHE_MAX_SIZE = int(os.getenv("OMNIGEN_SCHEMA_CACHE_MAX_SIZE", "5000"))
+
+# Introspection executor settings
+INTROSPECTION_WORKERS = int(os.getenv("OMNIGEN_INTROSPECTION_WORKERS", "8"))
+INTROSPECTION_PER_SOURCE = int(os.getenv("OMNIGEN_INTROSPECTION_PER_SOURCE", "2"))
+INTROSPECTION_TIMEOUT = float(os.getenv("OMNIGEN_INTROSPECTION_TIMEOUT", "120"))
+INTROSPECTION_BATCH_SIZE = int(os.getenv("OMNIGEN_INTROSPECTION_BATCH_SIZE", "50"))
+TABLE_STREAM_PAGE_SIZE = int(os.getenv("OMNIGEN_TABLE_STREAM_PAGE_SIZE", "500"))
+
+def normalize_db_url(db_url: str) -> str:
+    """Returns a canonical form of a connection URL, used as registry key."""
+    try:
+        url = make_url(db_url.strip())
+    except Exception:
+        return db_url.strip()
+    # Sort query parameters so that equivalent URLs share one engine
+    url = url.set(query=dict(sorted(url.query.items())))
+    return url.render_as_string(hide_password=False)
+
+def encode_table_cursor(table_name: str) -> str:
+    return base64.urlsafe_b64encode(table_name.encode("utf-8")).decode("ascii")
+
+def decode_table_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except Exception:
+        raise Exception("Invalid table cursor")
+
+class EngineRegistry:
+    """
+    Bounded LRU registry of SQLAlchemy engines keyed by normalized URL.
+    Engines that are evicted or stay idle longer than `idle_ttl` are disposed.
+    """
+    def __init__(self, max_size: int = ENGINE_REGISTRY_MAX_SIZE, idle_ttl: float = ENGINE_IDLE_TTL,
+                 pool_size: int = ENGINE_POOL_SIZE, max_overflow: int = ENGINE_MAX_OVERFLOW,
+                 pool_recycle: int = ENGINE_POOL_RECYCLE):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        self._engines: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _create(self, key: str) -> Engine:
+        kwargs: Dict[str, Any] = {"pool_pre_ping": True}
+        # SQLite uses its own pool classes which do not accept sizing options
+        if not key.startswith("sqlite"):
+            kwargs.update(
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_recycle=self.pool_recycle,
+            )
+        return create_engine(key, **kwargs)
+
+    def _reap(self, now: float) -> List[Engine]:
+        """Removes idle entries. Must be called with the lock held."""
+        expired = []
+        if self.idle_ttl <= 0:
+            return expired
+        for key in list(self._engines.keys()):
+            entry = self._engines[key]
+            if now - entry["last_used"] > self.idle_ttl:
+                expired.append(self._engines.pop(key)["engine"])
+                self._stats["expired"] += 1
+        return expired
+
+    def get(self, db_url: str) -> Engine:
+        """Returns a warm engine for the URL, creating it on first use."""
+        key = normalize_db_url(db_url)
+        now = time.monotonic()
+        to_dispose = []
+        with self._lock:
+            to_dispose.extend(self._reap(now))
+            entry = self._engines.get(key)
+            if entry is not None:
+                self._engines.move_to_end(key)
+                entry["last_used"] = now
+                entry["hits"] += 1
+                self._stats["hits"] += 1
+                engine = entry["engine"]
+            else:
+                self._stats["misses"] += 1
+                engine = self._create(key)
+                self._engines[key] = {"engine": engine, "created": now, "last_used": now, "hits": 0}
+                while len(self._engines) > self.max_size:
+                    _, evicted = self._engines.popitem(last=False)
+                    to_dispose.append(evicted["engine"])
+                    self._stats["evictions"] += 1
+        # Dispose outside of the lock, closing pooled connections can be slow
+        for old in to_dispose:
+            old.dispose()
+        return engine
+
+    def dispose(self, db_url: Optional[str] = None):
+        """Disposes one engine, or all of them when no URL is given."""
+        with self._lock:
+            if db_url is None:
+                engines = [e["engine"] for e in self._engines.values()]
+                self._engines.clear()
+            else:
+                entry = self._engines.pop(normalize_db_url(db_url), None)
+                engines = [entry["engine"]] if entry else []
+        for engine in engines:
+            engine.dispose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the currently registered engines."""
+        now = time.monotonic()
+        with self._lock:
+            engines = []
+            for key, entry in self._engines.items():
+                engines.append({
+                    "url": make_url(key).render_as_string(hide_password=True) if "://" in key else key,
+                    "hits": entry["hits"],
+                    "idle_seconds": round(now - entry["last_used"], 1),
+                    "pool": entry["engine"].pool.status(),
+                })
+            return {
+                **self._stats,
+                "size": len(self._engines),
+                "max_size": self.max_size,
+                "idle_ttl": self.idle_ttl,
+                "engines": engines,
+            }
+
+# Per-table catalog fingerprints; each query takes the list of table names as
+# `names` and returns (table_name, fingerprint source) rows
+FINGERPRINT_QUERIES = {
+    "postgresql": text("""
+        SELECT c.relname,
+               coalesce(obj_description(c.oid, 'pg_class'), '')
+               || coalesce((SELECT string_agg(p.conkey::text, ',') FROM pg_constraint p
+                            WHERE p.conrelid = c.oid AND p.contype = 'p'), '')
+               || string_agg(a.attname || ':' || format_type(a.atttypid, a.atttypmod) || ':'
+                             || a.attnotnull::text || ':' || coalesce(col_description(c.oid, a.attnum), ''),
+                             ',' ORDER BY a.attnum)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        WHERE n.nspname = current_schema() AND c.relname IN :names
+        GROUP BY c.oid, c.relname
+    """).bindparams(bindparam("names", expanding=True)),
+    "mysql": text("""
+        SELECT c.TABLE_NAME,
+               CONCAT(COUNT(*), '-', BIT_XOR(CRC32(CONCAT_WS(':', c.ORDINAL_POSITION, c.COLUMN_NAME, c.COLUMN_TYPE,
+                                                         c.IS_NULLABLE, c.COLUMN_KEY, c.COLUMN_COMMENT))),
+                      '-', MAX(t.TABLE_COMMENT))
+        FROM information_schema.COLUMNS c
+        JOIN information_schema.TABLES t ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+        WHERE c.TABLE_SCHEMA = DATABASE() AND c.TABLE_NAME IN :names
+        GROUP BY c.TABLE_NAME
+    """).bindparams(bindparam("names", expanding=True)),
+    "sqlite": text("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type IN ('table', 'view') AND name IN :names
+    """).bindparams(bindparam("names", expanding=True)),
+}
+
+# Bulk catalog queries for dialects whose inspector falls back to one query per
+# table (SQLAlchemy's MySQL dialect has no get_multi_* implementations). The
+# caller appends TABLE_NAME_FILTER when only some tables are wanted.
+TABLE_COMMENT_QUERIES = {
+    "mysql": """
+        SELECT TABLE_NAME, TABLE_COMMENT FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE()
+    """,
+}
+COLUMN_QUERIES = {
+    "mysql": """
+        SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_DEFAULT, COLUMN_KEY, COLUMN_COMMENT
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+    """,
+}
+TABLE_NAME_FILTER = " AND TABLE_NAME IN :names"
+
+def catalog_query(sql: str, names: Optional[List[str]] = None, order_by: str = ""):
+    """Builds a catalog query, optionally restricted to the given table names."""
+    if names is None:
+        return text(sql + order_by), {}
+    query = text(sql + TABLE_NAME_FILTER + order_by).bindparams(bindparam("names", expanding=True))
+    return query, {"names": list(names)}
+
+class SchemaCache:
+    """
+    In-process LRU cache of reflected table schemas keyed by (data source, table).
+    Entries expire after `ttl` seconds and are dropped early when the table's
+    catalog fingerprint no longer matches.
+    """
+    def __init__(self, ttl: float = SCHEMA_CACHE_TTL, max_size: int = SCHEMA_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0}
+
+    def get(self, source: str, table_name: str, fingerprint: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Returns the cached schema, or None when missing, expired or stale."""
+        key = (source, table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if self.ttl > 0 and time.monotonic() - entry["cached_at"] > self.ttl:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            if fingerprint is not None and entry["fingerprint"] != fingerprint:
+                del self._entries[key]
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            entry["hits"] += 1
+            self._stats["hits"] += 1
+            return entry["schema"]
+
+    def put(self, source: str, table_name: str, schema: Dict[str, Any], fingerprint: Optional[str] = None):
+        with self._lock:
+            self._entries[(source, table_name)] = {
+                "schema": schema,
+                "fingerprint": fingerprint,
+                "cached_at": time.monotonic(),
+                "hits": 0,
+            }
+            self._entries.move_to_end((source, table_name))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, db_url: Optional[str] = None, table_name: Optional[str] = None) -> int:
+        """Purges entries matching the data source and/or table. Returns the number removed."""
+        source = normalize_db_url(db_url) if db_url else None
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (source is None or key[0] == source) and (table_name is None or key[1] == table_name)
+            ]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns counters and a summary of every cached entry."""
+        now = time.monotonic()
+        with self._lock:
+            entries = []
+            for (source, table_name), entry in self._entries.items():
+                entries.append({
+                    "data_source": make_url(source).render_as_string(hide_password=True) if "://" in source else source,
+                    "table": table_name,
+                    "columns": len(entry["schema"].get("columns", [])),
+                    "fingerprint": entry["fingerprint"],
+                    "age_seconds": round(now - entry["cached_at"], 1),
+                    "hits": entry["hits"],
+                })
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "entries": entries,
+            }
+
+class IntrospectionExecutor:
+    """
+    Runs blocking introspection calls on a dedicated, size-bounded thread pool
+    so a slow data source can't stall the event loop. Concurrency is capped per
+    data source and each call is bounded by a timeout.
+    """
+    def __init__(self, max_workers: int = INTROSPECTION_WORKERS, per_source: int = INTROSPECTION_PER_SOURCE,
+                 timeout: float = INTROSPECTION_TIMEOUT, max_sources: int = ENGINE_REGISTRY_MAX_SIZE):
+        self.max_workers = max_workers
+        self.per_source = per_source
+        self.timeout = timeout
+        self.max_sources = max_sources
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="introspection")
+        # Per-source limits, LRU bounded like the engine registry: source -> {"sem", "users"}
+        self._limits: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _limit(self, source: str) -> Dict[str, Any]:
+        entry = self._limits.get(source)
+        if entry is None:
+            entry = self._limits[source] = {"sem": asyncio.Semaphore(self.per_source), "users": 0}
+        self._limits.move_to_end(source)
+        # Sources with calls waiting or running keep their semaphore, so the limit holds
+        excess = len(self._limits) - self.max_sources
+        if excess > 0:
+            idle = [key for key, e in self._limits.items() if e["users"] == 0 and key != source]
+            for key in idle[:excess]:
+                del self._limits[key]
+        return entry
+
+    def _release(self, entry: Dict[str, Any]):
+        entry["users"] -= 1
+        entry["sem"].release()
+
+    async def run(self, db_url: str, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) in the pool under the data source's concurrency limit."""
+        timeout = self.timeout if timeout is None else timeout
+        entry = self._limit(normalize_db_url(db_url))
+        loop = asyncio.get_running_loop()
+        entry["users"] += 1
+        try:
+            await entry["sem"].acquire()
+        except BaseException:
+            entry["users"] -= 1
+            raise
+        try:
+            fut = loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release(entry)
+            raise
+        # The slot is released when the thread finishes, not when we stop
+        # waiting, so timed out calls still count against the limit
+        fut.add_done_callback(lambda _: self._release(entry))
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), timeout if timeout > 0 else None)
+        except asyncio.TimeoutError:
+            raise Exception(f"Introspection timed out after {timeout:g}s")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
 
 class DbService:
     def __init__(self):
-        pass
+        self.engines = EngineRegistry()
+        self.schema_cache = SchemaCache()
+        self.executor = IntrospectionExecutor()
+
+    def get_engine(self, db_url: str) -> Engine:
+        return self.engines.get(db_url)
 
     def get_tables(self, db_url: str) -> List[Dict[str, Any]]:
         """
         Connects to the database and returns a list of tables with comments.
         """
+        return self.list_tables(db_url)["tables"]
+
+    def list_table_names(self, db_url: str, pattern: Optional[str] = None) -> List[str]:
+        """
+        Returns the sorted table names matching `pattern`. Patterns containing
+        glob characters (*, ?, [) are matched as globs, anything else as a
+        case-insensitive prefix.
+        """
         try:
-            engine = create_engine(db_url)
-            inspector = inspect(engine)
-            tables = []
-            for name in inspector.get_table_names():
-                try:
-                    comment = inspector.get_table_comment(name).get('text')
-                except:
-                    comment = None
-                tables.append({"name": name, "comment": comment})
-            return tables
+            engine = self.get_engine(db_url)
+            names = inspect(engine).get_table_names()
         except Exception as e:
             raise Exception(f"Failed to connect to database: {str(e)}")
+        if pattern:
+            needle = pattern.lower()
+            if any(ch in needle for ch in "*?["):
+                names = [n for n in names if fnmatch.fnmatchcase(n.lower(), needle)]
+            else:
+                names = [n for n in names if n.lower().startswith(needle)]
+        return sorted(names)
+
+    def get_table_comments(self, db_url: str, table_names: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+        """
+        Returns table comments with one bulk catalog query. Without names, the
+        comments of every table in the default schema are fetched. Comments are
+        optional metadata, so lookup failures are logged and yield no comments.
+        """
+        if table_names is not None and not table_names:
+            return {}
+        try:
+            engine = self.get_engine(db_url)
+            sql = TABLE_COMMENT_QUERIES.get(engine.dialect.name)
+            if sql is not None:
+                query, params = catalog_query(sql, table_names)
+                with engine.connect() as conn:
+                    rows = conn.execute(query, params).fetchall()
+                return {row[0]: row[1] or None for row in rows}
+
+            inspector = inspect(engine)
+            if table_names is None:
+                multi = inspector.get_multi_table_comment()
+            else:
+                multi = inspector.get_multi_table_comment(filter_names=list(table_names))
+        except NotImplementedError:
+            # Dialect has no table comments (e.g. SQLite)
+            return {}
+        except Exception as e:
+            print(f"Failed to read table comments: {e}")
+            return {}
+        return {key[1]: (c or {}).get('text') for key, c in multi.items()}
+
+    def list_tables(self, db_url: str, pattern: Optional[str] = None, cursor: Optional[str] = None,
+                    limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Returns a page of tables with comments. `cursor` is the opaque
+        `next_cursor` of the previous page; without `limit` every remaining
+        table is returned.
+        """
+        names = self.list_table_names(db_url, pattern)
+        total = len(names)
+        if cursor:
+            after = decode_table_cursor(cursor)
+            names = [n for n in names if n > after]
+        page = names[:limit] if limit is not None else names
+        next_cursor = encode_table_cursor(page[-1]) if limit is not None and len(names) > len(page) else None
+
+        # Unfiltered full listings fetch every comment in one query; pages only
+        # ask for their own tables
+        comments = self.get_table_comments(db_url, None if len(page) == total else page)
+        return {
+            "tables": [{"name": name, "comment": comments.get(name)} for name in page],
+            "total": total,
+            "next_cursor": next_cursor,
+        }
 
     def get_table_schema(self, db_url: str, table_name: str) -> Dict[str, Any]:
         """
         Returns schema information for a specific table.
         """
+        return self.get_table_schemas(db_url, [table_name])[table_name]
+
+    def get_table_schemas(self, db_url: str, table_names: List[str], use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns schema information for several tables, keyed by table name.
+        Columns, primary keys and comments are reflected with one catalog query
+        each instead of one round trip per table (SQLite, whose catalog is
+        local, is still read per table). Cached schemas are reused as
+        long as their fingerprint still matches the live catalog.
+        """
+        names = list(dict.fromkeys(table_names))
+        if not names:
+            return {}
+        try:
+            engine = self.get_engine(db_url)
+        except Exception as e:
+            raise Exception(f"Failed to inspect tables: {str(e)}")
+
+        source = normalize_db_url(db_url)
+        fingerprints = self._get_fingerprints(engine, names) if use_cache else None
+
+        result: Dict[str, Dict[str, Any]] = {}
+        misses = []
+        for name in names:
+            schema = None
+            # A table absent from a fingerprint result was dropped or renamed
+            if use_cache and (fingerprints is None or name in fingerprints):
+                schema = self.schema_cache.get(source, name, fingerprints.get(name) if fingerprints else None)
+            if schema is None:
+                misses.append(name)
+            else:
+                result[name] = schema
+
+        if misses:
+            reflected = self._reflect_schemas(engine, misses)
+            for name, schema in reflected.items():
+                self.schema_cache.put(source, name, schema, fingerprints.get(name) if fingerprints else None)
+                result[name] = schema
+
+        # Hand out copies so callers can't corrupt the cached dicts
+        return {name: copy.deepcopy(result[name]) for name in names}
+
+    async def alist_tables(self, db_url: str, pattern: Optional[str] = None, cursor: Optional[str] = None,
+                           limit: Optional[int] = None) -> Dict[str, Any]:
+        return await self.executor.run(db_url, self.list_tables, db_url, pattern, cursor, limit)
+
+    async def astream_tables(self, db_url: str, pattern: Optional[str] = None,
+                             page_size: int = TABLE_STREAM_PAGE_SIZE) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Yields NDJSON-ready events: `start` with the total, one `tables` event
+        per page (comments fetched in bulk per page) and a final `done`.
+        """
+        names = await self.executor.run(db_url, self.list_table_names, db_url, pattern)
+        yield {"type": "start", "total": len(names)}
+        for i in range(0, len(names), page_size):
+            page = names[i:i + page_size]
+            comments = await self.executor.run(db_url, self.get_table_comments, db_url, page)
+            yield {"type": "tables", "tables": [{"name": name, "comment": comments.get(name)} for name in page]}
+        yield {"type": "done"}
+
+    async def aget_table_schema(self, db_url: str, table_name: str) -> Dict[str, Any]:
+        return await self.executor.run(db_url, self.get_table_schema, db_url, table_name)
+
+    async def aget_table_schemas(self, db_url: str, table_names: List[str], use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Async variant of get_table_schemas. Large selections are split into
+        batches which are reflected concurrently on the introspection pool.
+        """
+        names = list(dict.fromkeys(table_names))
+        batches = [names[i:i + INTROSPECTION_BATCH_SIZE] for i in range(0, len(names), INTROSPECTION_BATCH_SIZE)]
+        results = await asyncio.gather(*[
+            self.executor.run(db_url, self.get_table_schemas, db_url, batch, use_cache=use_cache)
+            for batch in batches
+        ])
+        merged: Dict[str, Dict[str, Any]] = {}
+        for result in results:
+            merged.update(result)
+        return {name: merged[name] for name in names}
+
+    def _reflect_schemas(self, engine: Engine, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        if engine.dialect.name in COLUMN_QUERIES:
+            return self._reflect_schemas_bulk(engine, names)
         try:
-            engine = create_engine(db_url)
             inspector = inspect(engine)
-            
-            columns = []
-            pk_constraint = inspector.get_pk_constraint(table_name)
-            pk_columns = pk_constraint.get('constrained_columns', [])
-
-            for col in inspector.get_columns(table_name):
-                columns.append({
-                    "name": col["name"],
-                    "type": str(col["type"]),
-                    "nullable": col["nullable"],
-                    "default": str(col["default"]) if col.get("default") else None,
-                    "primary_key": col["name"] in pk_columns,
-                    "comment": col.get("comment")
-                })
-            
-            return {
-                "table_name": table_name,
-                "columns": columns
-            }
+            multi_columns = inspector.get_multi_columns(filter_names=names, kind=ObjectKind.ANY)
+            multi_pks = inspector.get_multi_pk_constraint(filter_names=names, kind=ObjectKind.ANY)
+            try:
+                multi_comments = inspector.get_multi_table_comment(filter_names=names, kind=ObjectKind.ANY)
+            except NotImplementedError:
+                # Dialect has no table comments (e.g. SQLite)
+                multi_comments = {}
+        except Exception as e:
+            raise Exception(f"Failed to inspect tables: {str(e)}")
+
+        # Results are keyed by (schema, table); we only reflect the default schema
+        columns_by_table = {key[1]: cols for key, cols in multi_columns.items()}
+        pks_by_table = {key[1]: pk for key, pk in multi_pks.items()}
+        comments_by_table = {key[1]: c for key, c in multi_comments.items()}
+
+        missing = [name for name in names if name not in columns_by_table]
+        if missing:
+            raise Exception(f"Failed to inspect table {', '.join(missing)}: table not found")
+
+        return {
+            name: self._build_schema(
+                name,
+                columns_by_table[name],
+                pks_by_table.get(name) or {},
+                comments_by_table.get(name) or {},
+            )
+            for name in names
+        }
+
+    def _reflect_schemas_bulk(self, engine: Engine, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Reflects the tables with the dialect's COLUMN_QUERIES and
+        TABLE_COMMENT_QUERIES, for dialects whose inspector has no bulk
+        reflection.
+        """
+        dialect = engine.dialect.name
+        try:
+            column_query, params = catalog_query(COLUMN_QUERIES[dialect], names,
+                                                 " ORDER BY TABLE_NAME, ORDINAL_POSITION")
+            comment_query, _ = catalog_query(TABLE_COMMENT_QUERIES[dialect], names)
+            with engine.connect() as conn:
+                column_rows = conn.execute(column_query, params).fetchall()
+                comment_rows = conn.execute(comment_query, params).fetchall()
         except Exception as e:
-            raise Exception(f"Failed to inspect table {table_name}: {str(e)}")
+            raise Exception(f"Failed to inspect tables: {str(e)}")
+
+        columns_by_table: Dict[str, List[Dict[str, Any]]] = {}
+        pks_by_table: Dict[str, List[str]] = {}
+        for table, column, column_type, is_nullable, default, key, comment in column_rows:
+            columns_by_table.setdefault(table, []).append({
+                "name": column,
+                "type": column_type.upper(),
+                "nullable": is_nullable == "YES",
+                "default": default,
+                "comment": comment or None,
+            })
+            if key == "PRI":
+                pks_by_table.setdefault(table, []).append(column)
+        comments_by_table = {row[0]: row[1] or None for row in comment_rows}
+
+        missing = [name for name in names if name not in columns_by_table]
+        if missing:
+            raise Exception(f"Failed to inspect table {', '.join(missing)}: table not found")
+
+        return {
+            name: self._build_schema(
+                name,
+                columns_by_table[name],
+                {"constrained_columns": pks_by_table.get(name, [])},
+                {"text": comments_by_table.get(name)},
+            )
+            for name in names
+        }
+
+    def _get_fingerprints(self, engine: Engine, names: List[str]) -> Optional[Dict[str, str]]:
+        """
+        Returns a cheap per-table fingerprint of the catalog definition, computed
+        with a single query. Returns None for dialects without a fingerprint
+        query, in which case the cache relies on its TTL alone.
+        """
+        query = FINGERPRINT_QUERIES.get(engine.dialect.name)
+        if query is None:
+            return None
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(query, {"names": names}).fetchall()
+        except Exception as e:
+            print(f"Schema fingerprint query failed, falling back to TTL: {e}")
+            return None
+        return {row[0]: hashlib.md5(str(row[1]).encode("utf-8")).hexdigest() for row in rows}
+
+    def _build_schema(self, table_name: str, raw_columns: List[Dict[str, Any]], pk_constraint: Dict[str, Any],
+                      table_comment: Dict[str, Any]) -> Dict[str, Any]:
+        pk_columns = pk_constraint.get('constrained_columns') or []
+        columns = []
+        for col in raw_columns:
+            columns.append({
+                "name": col["name"],
+                "type": str(col["type"]),
+                "nullable": col["nullable"],
+                "default": str(col["default"]) if col.get("default") else None,
+                "primary_key": col["name"] in pk_columns,
+                "comment": col.get("comment")
+            })
+
+        return {
+            "table_name": table_name,
+            "comment": table_comment.get('text'),
+            "columns": columns
+        }
 
 db_service = DbService()
@@ -1,10 +1,19 @@
+import hashlib
 import json
+import multiprocessing
+import os
 import re
-from jinja2 import Environment, DictLoader
-from typing import Dict, Any, Tuple, Generator
-from sqlalchemy.orm import Session
-from app.models import Template
-from app.services.llm_service import llm_service
+import tempfile
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, Tuple, Generator, AsyncGenerator, List, Optional, Union
+from sqlalchemy.orm import Session, selectinload
+from app.models import Template, TemplateGroup
+from app.services.llm_service import clean_completion, llm_service
+from app.services.output_cache import OutputCache, output_key, schema_hash
+from app.services.schema_prompt import SCHEMA_TOKEN_BUDGET, format_schema
+from app.services.template_cache import PathRenderer, TemplateCache, content_hash
 
 # Custom Filters
 def to_camel_case(s: str) -> str:
@@ -55,34 +64,202 @@ def to_java_type(sql_type: str) -> str:
         
     return 'String' # Default
 
-def format_schema_to_prompt(schema: Dict[str, Any]) -> str:
-    """Formats table schema into a readable string for LLM."""
-    table_name = schema.get("name", "Unknown")
-    comment = schema.get("comment", "")
-    columns = schema.get("columns", [])
-    
-    lines = []
-    lines.append(f"Table Name: {table_name}")
-    if comment:
-        lines.append(f"Table Comment: {comment}")
-    lines.append("Columns:")
-    
-    for col in columns:
-        c_name = col['name']
-        c_type = col['type']
-        c_pk = " (PK)" if col.get('primary_key') else ""
-        c_comment = f" - {col['comment']}" if col.get('comment') else ""
-        lines.append(f"- {c_name} ({c_type}){c_pk}{c_comment}")
-        
-    return "\n".join(lines)
+def format_schema_to_prompt(schema: Dict[str, Any], schema_format: str = "full", budget: Optional[int] = None) -> str:
+    """Formats table schema into a readable string for LLM, compacted to fit budget tokens."""
+    return format_schema(schema, schema_format, budget)[0]
+
+# Parallel rendering settings. Jinja rendering is pure Python and holds the GIL,
+# so only "process" spreads renders over all cores; it pays for spawning the
+# workers once and pickling each template and context. "thread" skips that
+# overhead but renders on one core, which only suits small template sets.
+RENDER_WORKERS = int(os.getenv("OMNIGEN_RENDER_WORKERS", str(os.cpu_count() or 1)))
+RENDER_POOL = os.getenv("OMNIGEN_RENDER_POOL", "process")
+# Streamed Jinja output is coalesced into chunks of at least this many characters
+STREAM_CHUNK_SIZE = int(os.getenv("OMNIGEN_STREAM_CHUNK_SIZE", "16384"))
+
+# Process umask, applied to generated files written through a temp file
+FILE_UMASK = os.umask(0)
+os.umask(FILE_UMASK)
+
+# Part of every output cache key; bump when a filter's behaviour changes so
+# previously cached renders are not reused
+FILTER_VERSION = "1"
+
+# Multi-file LLM output format used by batched generation
+BATCH_END_MARKER = "=== END FILE ==="
+BATCH_FILE_PATTERN = re.compile(r"^=== FILE: (.+?) ===[ \t]*$", re.MULTILINE)
+# Stands in for schema_text in template prompts; the schema itself is sent
+# ahead of the prompt as a shared, prefix-cacheable context message
+SCHEMA_REFERENCE = "(the table schema given above)"
+# Draft mode: the template's Jinja output is appended to the prompt for the LLM to edit
+DRAFT_INSTRUCTION = (
+    "Start from the draft below, rendered from this file's code template. Keep everything that already "
+    "satisfies the instructions and only change what they require. Output the complete file."
+)
+DRAFT_BEGIN = "=== DRAFT ==="
+DRAFT_END = "=== END DRAFT ==="
+
+def with_draft(prompt: str, draft: Optional[str]) -> str:
+    """Appends a draft for the LLM to edit to an instruction."""
+    if draft is None:
+        return prompt
+    return f"{prompt}\n\n{DRAFT_INSTRUCTION}\n{DRAFT_BEGIN}\n{draft}\n{DRAFT_END}"
+
+def parse_batch_response(text: str, labels: List[str]) -> Dict[str, str]:
+    """
+    Splits a multi-file completion into {label: code}. Files that are missing,
+    unknown or empty are left out, so the caller can generate them one by one.
+    """
+    files = {}
+    matches = list(BATCH_FILE_PATTERN.finditer(text or ""))
+    for i, match in enumerate(matches):
+        label = match.group(1).strip()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = clean_completion(text[match.end():end].split(BATCH_END_MARKER, 1)[0])
+        if label in labels and label not in files and body:
+            files[label] = body
+    return files
+
+TEMPLATE_FILTERS = {
+    'to_camel_case': to_camel_case,
+    'to_pascal_case': to_pascal_case,
+    'to_kebab_case': to_kebab_case,
+    'to_java_type': to_java_type,
+}
+
+def template_snapshot(template: Template) -> Dict[str, Any]:
+    """Plain, picklable copy of the fields needed to render a template's content."""
+    return {
+        "id": template.id,
+        "name": template.name,
+        "content": template.content,
+        "updated_at": template.updated_at,
+    }
+
+def render_template_unit(snapshot: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Renders one (table, template) work unit. Runs inside render pool workers,
+    each of which keeps its own compiled template cache.
+    """
+    start = time.perf_counter()
+    try:
+        code = generator_service.render_content(snapshot, context)
+        error = None
+    except Exception as e:
+        code = None
+        error = str(e)
+    return {"code": code, "error": error, "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+class StreamingFileWriter:
+    """
+    Writes a generated file chunk by chunk into a temporary file next to the
+    target, which replaces the target on commit(). Readers never see a
+    half-written file and the whole content is never held in memory. When the
+    target already has identical content it is left untouched, so its mtime
+    doesn't change and downstream builds stay incremental.
+    """
+    def __init__(self, full_path: str):
+        self.full_path = full_path
+        directory = os.path.dirname(full_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A unique temp file per writer; concurrent runs may write the same target
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory or None, prefix=os.path.basename(full_path) + ".", suffix=".tmp")
+        # mkstemp creates it private; the file gets the permissions a plain open() would give it
+        os.chmod(self.tmp_path, 0o666 & ~FILE_UMASK)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self._size = 0
+
+    def write(self, chunk: str):
+        data = chunk.encode("utf-8")
+        self._file.write(data)
+        self._hash.update(data)
+        self._size += len(data)
+
+    def reset(self, text: str = ""):
+        """Discards what was written so far, e.g. to store an error message instead."""
+        self._file.seek(0)
+        self._file.truncate()
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self.write(text)
+
+    def _target_matches(self) -> bool:
+        try:
+            if os.path.getsize(self.full_path) != self._size:
+                return False
+            existing = hashlib.sha256()
+            with open(self.full_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    existing.update(block)
+            return existing.digest() == self._hash.digest()
+        except OSError:
+            return False
+
+    def commit(self) -> str:
+        """Swaps the file in. Returns "written", or "unchanged" if the content was identical."""
+        self._file.close()
+        if self._target_matches():
+            os.remove(self.tmp_path)
+            return "unchanged"
+        os.replace(self.tmp_path, self.full_path)
+        return "written"
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
 
 class GeneratorService:
     def __init__(self):
-        # We will use DictLoader which allows loading templates from a dictionary
-        # However, since templates are in DB, we'll need to fetch them dynamically or recreate env
-        # For simplicity, we can recreate env or use a custom loader if needed.
-        # But simpler approach for render: just create a temporary env with the specific template content
-        pass
+        # Templates live in the DB, so compiled content and prompt templates are
+        # kept in a shared cache keyed by template id and version
+        self.template_cache = TemplateCache(TEMPLATE_FILTERS)
+        self.path_renderer = PathRenderer(TEMPLATE_FILTERS)
+        self.output_cache = OutputCache()
+        self._render_pool: Optional[Executor] = None
+        self._render_pool_lock = threading.Lock()
+
+    def invalidate_template(self, template_id: Optional[int] = None):
+        """Drops compiled versions of a template (all templates without id)."""
+        self.template_cache.invalidate(template_id)
+
+    def warm_up(self, templates: List[Template]) -> Dict[str, Any]:
+        """
+        Precompiles the content and prompt of the given templates so the first
+        generate request renders at warm speed. Returns compile counts and errors.
+        """
+        compiled = 0
+        errors = []
+        for template in templates:
+            for kind, source in (("content", template.content), ("prompt", template.prompt)):
+                if not source:
+                    continue
+                try:
+                    self.template_cache.get(template.id, kind, source, template.updated_at)
+                    compiled += 1
+                except Exception as e:
+                    errors.append({"template_id": template.id, "name": template.name, "kind": kind, "error": str(e)})
+        return {"compiled": compiled, "errors": errors}
+
+    def resolve_output_path(self, template: Template, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Renders a template's root_path/relative_path for one table context.
+        Returns the rendered parts, the joined full path and a path error if
+        either pattern failed (the raw pattern is used in that case).
+        """
+        root, root_error = self.path_renderer.render(template.root_path, context)
+        relative, relative_error = self.path_renderer.render(template.relative_path, context)
+        prefix = root if not root or root.endswith("/") else root + "/"
+        return {
+            "root_path": root,
+            "relative_path": relative,
+            "full_path": prefix + relative,
+            "error": root_error or relative_error,
+        }
 
     def get_available_templates(self, db: Session) -> list[str]:
         """Returns a list of available template names from DB."""
@@ -135,89 +312,312 @@ class GeneratorService:
             raise Exception(f"Template not found")
         db.delete(template)
         db.commit()
+        self.invalidate_template(template_id)
 
-    def generate_code(self, db: Session, template_id: int, context: Dict[str, Any], use_llm: bool = False) -> str:
-        """Generates code based on a template and context."""
-        template = db.query(Template).filter(Template.id == template_id).first()
+    def get_group_with_templates(self, db: Session, group_id: int) -> Optional[TemplateGroup]:
+        """Loads a template group and all of its templates in two queries."""
+        return (
+            db.query(TemplateGroup)
+            .options(selectinload(TemplateGroup.templates))
+            .filter(TemplateGroup.id == group_id)
+            .first()
+        )
+
+    def _resolve_template(self, db: Session, template: Union[Template, int]) -> Optional[Template]:
+        # Callers in the generate pipeline pass already loaded templates; an id
+        # still works but costs a query
+        if isinstance(template, int):
+            return db.query(Template).filter(Template.id == template).first()
+        return template
+
+    def uses_llm(self, template: Template, use_llm: bool, use_draft: bool = False) -> bool:
+        """Whether a file is generated by the LLM; in draft mode templates without a prompt are plain Jinja templates."""
+        return use_llm and not (use_draft and not template.prompt)
+
+    def generate_code(self, db: Session, template: Union[Template, int], context: Dict[str, Any], use_llm: bool = False,
+                      use_llm_cache: bool = True, use_draft: bool = False) -> str:
+        """
+        Generates code based on a template (object or id) and context. With
+        use_draft the LLM edits the template's Jinja output (see render_draft).
+        """
+        template = self._resolve_template(db, template)
         if not template:
             raise Exception(f"Template not found")
         
         # Branch 1: LLM Generation
-        if use_llm:
-             # Check if prompt exists
-             if not template.prompt:
-                 raise Exception("Template has no prompt configured for AI generation.")
-             
-             # Prepare Prompt
-             # We inject schema_text into context
-             schema_text = format_schema_to_prompt(context)
-             llm_context = context.copy()
-             llm_context["schema_text"] = schema_text
-             
-             # Render Prompt Template (The prompt itself can use Jinja2)
-             env = Environment(loader=DictLoader({"prompt": template.prompt}))
-             try:
-                 tmpl = env.get_template("prompt")
-                 rendered_prompt = tmpl.render(llm_context)
-             except Exception as e:
-                 raise Exception(f"Error rendering prompt template: {str(e)}")
-             
+        if self.uses_llm(template, use_llm, use_draft):
              # Call LLM
-             return llm_service.chat_completion(db, rendered_prompt)
+             draft = self.render_draft(template, context) if use_draft else None
+             schema_context, prompt = self.build_llm_prompt(db, template, context, draft=draft)
+             return llm_service.chat_completion(db, prompt, use_cache=use_llm_cache, context=schema_context,
+                                                prediction=draft)
 
         # Branch 2: Standard Jinja2 Generation
-        env = Environment(loader=DictLoader({str(template.id): template.content}))
-        
-        # Register Filters
-        env.filters['to_camel_case'] = to_camel_case
-        env.filters['to_pascal_case'] = to_pascal_case
-        env.filters['to_kebab_case'] = to_kebab_case
-        env.filters['to_java_type'] = to_java_type
-        
+        return self.render_content(template, context)
+
+    def build_prompt(self, template: Template, context: Dict[str, Any], schema_text: Optional[str] = None) -> str:
+        """Renders a template's LLM prompt; the prompt can use Jinja2 and schema_text."""
+        # Check if prompt exists
+        if not template.prompt:
+            raise Exception("Template has no prompt configured for AI generation.")
+
+        # Prepare Prompt
+        # We inject schema_text into context
+        llm_context = context.copy()
+        llm_context["schema_text"] = format_schema_to_prompt(context) if schema_text is None else schema_text
+
+        try:
+            tmpl = self.template_cache.get(template.id, "prompt", template.prompt, template.updated_at)
+            return tmpl.render(llm_context)
+        except Exception as e:
+            raise Exception(f"Failed to render prompt template: {str(e)}")
+
+    def schema_context(self, db: Session, context: Dict[str, Any], usage: Optional[Dict[str, Any]] = None) -> str:
+        """
+        The per-table part of LLM requests, identical for every template of the
+        table. It is compacted to the active LLM config's schema token budget;
+        the tokens it takes and saves are written into `usage` when given.
+        """
+        config = llm_service.get_active_config(db)
+        schema_format = (config.schema_format if config else None) or "full"
+        budget = (config.schema_token_budget if config else None) or SCHEMA_TOKEN_BUDGET
+        text, report = format_schema(context, schema_format, budget)
+        if usage is not None:
+            usage.update(report)
+        return text
+
+    def build_llm_prompt(self, db: Session, template: Template, context: Dict[str, Any],
+                         usage: Optional[Dict[str, Any]] = None, draft: Optional[str] = None) -> Tuple[Optional[str], str]:
+        """
+        Returns (shared schema context, template instruction). Prompts using
+        schema_text get the schema as a separate leading message, so all
+        templates of a table share that prefix; other prompts are sent as is.
+        A draft goes last, after the instruction.
+        """
+        schema_text = self.schema_context(db, context, usage)
+        if template.prompt and "schema_text" in template.prompt:
+            return schema_text, with_draft(self.build_prompt(template, context, SCHEMA_REFERENCE), draft)
+        return None, with_draft(self.build_prompt(template, context, schema_text), draft)
+
+    def render_draft(self, template: Template, context: Dict[str, Any]) -> Optional[str]:
+        """
+        The template's Jinja output, used as the LLM's starting point in draft
+        mode. None when the template has no content or it fails to render.
+        """
+        if not template.content:
+            return None
+        key = self.output_cache_key(template, context)
+        draft = self.output_cache.get(key)
+        if draft is None:
+            try:
+                draft = self.render_content(template, context)
+            except Exception as e:
+                print(f"Draft for {template.name} failed to render, generating without it: {e}")
+                return None
+            self.output_cache.put(key, draft)
+        return draft
+
+    async def agenerate_code(self, db: Session, template: Union[Template, int], context: Dict[str, Any], use_llm: bool = True,
+                             use_llm_cache: bool = True, usage: Optional[Dict[str, Any]] = None,
+                             use_draft: bool = False) -> str:
+        """Async generate_code; LLM calls don't block the event loop and may run concurrently."""
+        template = self._resolve_template(db, template)
+        if not template:
+            raise Exception(f"Template not found")
+        if self.uses_llm(template, use_llm, use_draft):
+            draft = self.render_draft(template, context) if use_draft else None
+            schema_context, prompt = self.build_llm_prompt(db, template, context, usage, draft)
+            if draft is not None and usage is not None:
+                usage["draft"] = True
+            return await llm_service.achat_completion(db, prompt, use_cache=use_llm_cache, context=schema_context,
+                                                      usage=usage, prediction=draft)
+        return self.render_content(template, context)
+
+    async def agenerate_code_stream(self, db: Session, template: Union[Template, int], context: Dict[str, Any],
+                                    use_llm_cache: bool = True, usage: Optional[Dict[str, Any]] = None,
+                                    use_draft: bool = False) -> AsyncGenerator[str, None]:
+        """
+        Async LLM variant of generate_code_stream. Files that aren't generated
+        by the LLM (see uses_llm) go through generate_code_stream instead.
+        """
+        template = self._resolve_template(db, template)
+        if not template:
+            yield ""
+            return
+        draft = self.render_draft(template, context) if use_draft else None
+        schema_context, prompt = self.build_llm_prompt(db, template, context, usage, draft)
+        if draft is not None and usage is not None:
+            usage["draft"] = True
+        async for chunk in llm_service.achat_completion_stream(db, prompt, use_cache=use_llm_cache,
+                                                               context=schema_context, usage=usage, prediction=draft):
+            yield chunk
+
+    def batch_labels(self, templates: List[Template], context: Dict[str, Any]) -> Dict[int, str]:
+        """Names each template's file in a batched prompt: its output path, made unique."""
+        labels = {}
+        for tmpl in templates:
+            label = self.resolve_output_path(tmpl, context)["relative_path"] or tmpl.name
+            if label in labels.values():
+                label = f"{label} #{tmpl.id}"
+            labels[tmpl.id] = label
+        return labels
+
+    def build_batch_prompt(self, templates: List[Template], context: Dict[str, Any], labels: Dict[int, str],
+                           drafts: Optional[Dict[int, str]] = None) -> str:
+        """
+        One instruction asking for every file of a table. The schema is sent
+        separately as the shared context, like for per-file requests.
+        """
+        drafts = drafts or {}
+        sections = [
+            f"Generate the following {len(templates)} files for the table above.",
+            "",
+            "Output every file in exactly this format and nothing else:",
+            "=== FILE: <file name> ===",
+            "<code>",
+            BATCH_END_MARKER,
+        ]
+        for tmpl in templates:
+            # Not in the output format, so the model can't mistake an instruction for a file
+            sections += ["", f"--- Instructions for {labels[tmpl.id]} ---",
+                         with_draft(self.build_prompt(tmpl, context, SCHEMA_REFERENCE), drafts.get(tmpl.id))]
+        return "\n".join(sections)
+
+    def batch_prediction(self, templates: List[Template], labels: Dict[int, str], drafts: Dict[int, str]) -> Optional[str]:
+        """The drafts in the batched output format, i.e. the expected response."""
+        files = [f"=== FILE: {labels[t.id]} ===\n{drafts[t.id]}\n{BATCH_END_MARKER}" for t in templates if t.id in drafts]
+        return "\n\n".join(files) if files else None
+
+    async def agenerate_table_batch(self, db: Session, templates: List[Template], context: Dict[str, Any],
+                                    use_llm_cache: bool = True, usage: Optional[Dict[str, Any]] = None,
+                                    use_draft: bool = False) -> Dict[int, str]:
+        """
+        Generates all files of a table with one completion. Returns {template id: code}
+        for the files that could be parsed; the rest should be generated per file.
+        """
+        batchable = [t for t in templates if t.prompt]
+        if len(batchable) < 2:
+            return {}
+        labels = self.batch_labels(batchable, context)
+        drafts = {}
+        if use_draft:
+            for tmpl in batchable:
+                draft = self.render_draft(tmpl, context)
+                if draft is not None:
+                    drafts[tmpl.id] = draft
+            if drafts and usage is not None:
+                usage["draft"] = True
+        try:
+            prompt = self.build_batch_prompt(batchable, context, labels, drafts)
+            schema_text = self.schema_context(db, context, usage)
+            text = await llm_service.achat_completion(db, prompt, use_cache=use_llm_cache, context=schema_text, usage=usage,
+                                                      prediction=self.batch_prediction(batchable, labels, drafts))
+        except Exception as e:
+            print(f"Batched generation failed for {context.get('TableName')}, falling back to per-file calls: {e}")
+            return {}
+        files = parse_batch_response(text, list(labels.values()))
+        codes = {tmpl_id: files[label] for tmpl_id, label in labels.items() if label in files}
+        if len(codes) < len(batchable):
+            print(f"Batched response for {context.get('TableName')} had {len(codes)} of {len(batchable)} files, "
+                  f"generating the rest per file")
+            # An incomplete response would otherwise be replayed from the cache on every run
+            await llm_service.adiscard_response(db, prompt, schema_text)
+        return codes
+
+    def render_content(self, template: Union[Template, Dict[str, Any]], context: Dict[str, Any]) -> str:
+        """Renders a template's Jinja content. Accepts a Template or a template_snapshot()."""
+        if isinstance(template, dict):
+            template_id, name, content, updated_at = (
+                template["id"], template["name"], template["content"], template["updated_at"]
+            )
+        else:
+            template_id, name, content, updated_at = template.id, template.name, template.content, template.updated_at
+        # Compiled once, filters registered on the shared env
         try:
-            tmpl = env.get_template(str(template.id))
+            tmpl = self.template_cache.get(template_id, "content", content, updated_at)
             return tmpl.render(context)
+        except Exception as e:
+            raise Exception(f"Error generating code from template {name}: {str(e)}")
+
+    def output_cache_key(self, template: Template, context: Dict[str, Any]) -> str:
+        """Content address of a Jinja render: template source, schema and filter version."""
+        return output_key(content_hash(template.content), schema_hash(context), FILTER_VERSION)
+
+    def write_output(self, full_path: str, code: str) -> str:
+        """Writes a generated file unless identical content is already on disk. Returns the write status."""
+        writer = StreamingFileWriter(full_path)
+        try:
+            writer.write(code)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def render_content_stream(self, template: Template, context: Dict[str, Any],
+                              chunk_size: int = STREAM_CHUNK_SIZE) -> Generator[str, None, None]:
+        """Streams a template's Jinja content through generate(), coalescing small pieces."""
+        try:
+            tmpl = self.template_cache.get(template.id, "content", template.content, template.updated_at)
         except Exception as e:
             raise Exception(f"Error generating code from template {template.name}: {str(e)}")
+        parts = []
+        size = 0
+        try:
+            for piece in tmpl.generate(context):
+                parts.append(piece)
+                size += len(piece)
+                if size >= chunk_size:
+                    yield "".join(parts)
+                    parts = []
+                    size = 0
+        except Exception as e:
+            raise Exception(f"Error generating code from template {template.name}: {str(e)}")
+        if parts:
+            yield "".join(parts)
 
-    def generate_code_stream(self, db: Session, template_id: int, context: Dict[str, Any], use_llm: bool = True) -> Generator[str, None, None]:
-        """Generates code stream based on a template and context."""
-        template = db.query(Template).filter(Template.id == template_id).first()
+    def render_pool(self) -> Executor:
+        """Returns the process-wide render pool, created on first use."""
+        with self._render_pool_lock:
+            if self._render_pool is None:
+                if RENDER_POOL == "thread":
+                    self._render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+                else:
+                    # Spawned, not forked: a fork would copy this worker's threads,
+                    # DB pools and HTTP clients into the children
+                    self._render_pool = ProcessPoolExecutor(
+                        max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                    )
+            return self._render_pool
+
+    def submit_render(self, template: Template, context: Dict[str, Any]) -> Future:
+        """Schedules one (table, template) unit on the render pool."""
+        return self.render_pool().submit(render_template_unit, template_snapshot(template), context)
+
+    def shutdown(self):
+        with self._render_pool_lock:
+            if self._render_pool is not None:
+                self._render_pool.shutdown(wait=False)
+                self._render_pool = None
+
+    def generate_code_stream(self, db: Session, template: Union[Template, int], context: Dict[str, Any], use_llm: bool = True,
+                             use_llm_cache: bool = True) -> Generator[str, None, None]:
+        """Generates code stream based on a template (object or id) and context."""
+        template = self._resolve_template(db, template)
         if not template:
             yield ""
             return
         
         # Branch 1: LLM Generation (Stream)
+        # Errors propagate, so callers can fail the file instead of writing an error comment
         if use_llm:
-             # Check if prompt exists
-             if not template.prompt:
-                 yield "// Error: Template has no prompt configured for AI generation."
-                 return
-             
              # Prepare Prompt
-             schema_text = format_schema_to_prompt(context)
-             llm_context = context.copy()
-             llm_context["schema_text"] = schema_text
-             
-             # Render Prompt Template
-             env = Environment(loader=DictLoader({"prompt": template.prompt}))
-             try:
-                 tmpl = env.get_template("prompt")
-                 rendered_prompt = tmpl.render(llm_context)
-             except Exception as e:
-                 yield f"// Error rendering prompt template: {str(e)}"
-                 return
+             schema_context, prompt = self.build_llm_prompt(db, template, context)
              
              # Call LLM Stream
-             yield from llm_service.chat_completion_stream(db, rendered_prompt)
+             yield from llm_service.chat_completion_stream(db, prompt, use_cache=use_llm_cache, context=schema_context)
              return
 
-        # Branch 2: Standard Jinja2 Generation (Non-stream, but we mock it)
-        # ... (Existing logic but yielded)
-        try:
-            code = self.generate_code(db, template_id, context, use_llm=False)
-            yield code
-        except Exception as e:
-            yield f"// Error: {str(e)}"
+        # Branch 2: Standard Jinja2 Generation, streamed in coalesced chunks
+        yield from self.render_content_stream(template, context)
 
 generator_service = GeneratorService()
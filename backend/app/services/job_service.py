@@ -0,0 +1,388 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.models import GenerationJob, GenerationJobFile, SessionLocal
+from app.services.db_service import db_service
+from app.services.generator_service import generator_service
+from app.services.snapshot_service import snapshot_service
+
+JOB_WORKERS = int(os.getenv("OMNIGEN_JOB_WORKERS", "2"))
+# Every worker writes a heartbeat for its jobs and looks for abandoned jobs this often (seconds)
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("OMNIGEN_JOB_HEARTBEAT_INTERVAL", "30"))
+# A job without heartbeat for this long is considered interrupted
+JOB_STALE_AFTER = float(os.getenv("OMNIGEN_JOB_STALE_AFTER", "120"))
+# Resume interrupted jobs automatically instead of waiting for a user to resume them
+JOB_AUTO_RESUME = os.getenv("OMNIGEN_JOB_AUTO_RESUME", "").lower() in ("1", "true", "yes")
+JOB_POLL_INTERVAL = float(os.getenv("OMNIGEN_JOB_POLL_INTERVAL", "1.0"))
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled", "interrupted")
+RESUMABLE_STATUSES = ("failed", "cancelled", "interrupted")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class JobCancelled(Exception):
+    pass
+
+class JobLost(Exception):
+    """The job was taken over (marked interrupted, cancelled or resumed) while this worker ran it."""
+    pass
+
+def worker_is_dead(worker: Optional[str]) -> bool:
+    """Whether a host:pid worker id names a process of this host that no longer exists."""
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if worker == WORKER_ID:
+        # This process; its own jobs are known to the JobService
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+class JobService:
+    """
+    Runs generation requests as background jobs. Job state and every finished
+    file are stored in the app DB, so progress survives worker restarts and a
+    resumed job skips files that already completed. A heartbeat thread keeps
+    the jobs of this worker alive and hands jobs of dead workers over.
+    """
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-job")
+        self._cancel_events: Dict[str, threading.Event] = {}
+        # Jobs submitted to this worker that haven't finished (queued or running)
+        self._local: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._heartbeat: Optional[threading.Thread] = None
+        self._heartbeat_stop = threading.Event()
+
+    def start(self):
+        """Recovers abandoned jobs and starts the heartbeat thread, which repeats that periodically."""
+        self.recover_stale()
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="generation-job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def create_job(self, db: Session, request: Dict[str, Any]) -> GenerationJob:
+        job = GenerationJob(id=uuid.uuid4().hex, status="pending", request_json=json.dumps(request), worker=WORKER_ID)
+        # Local before it is stored, so recovery never sees it unowned; submit() queues it
+        with self._lock:
+            self._local.add(job.id)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def get_job(self, db: Session, job_id: str) -> Optional[GenerationJob]:
+        return db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+
+    def list_jobs(self, db: Session, limit: int = 50) -> List[GenerationJob]:
+        return db.query(GenerationJob).order_by(GenerationJob.created_at.desc()).limit(limit).all()
+
+    def submit(self, job_id: str):
+        """Schedules a pending job on this worker's job pool."""
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+            self._local.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def cancel(self, db: Session, job_id: str) -> GenerationJob:
+        """Requests cooperative cancellation; the runner stops before its next file."""
+        job = self.get_job(db, job_id)
+        if not job:
+            raise Exception("Job not found")
+        if job.status in FINISHED_STATUSES:
+            return job
+        # Stored in the DB so a job running on another worker sees it too
+        job.cancel_requested = 1
+        # Nobody runs an abandoned job to notice the request
+        if job.status == "pending" or self._abandoned(job, datetime.utcnow()):
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+        db.commit()
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if event:
+            event.set()
+        db.refresh(job)
+        return job
+
+    def resume(self, db: Session, job_id: str) -> GenerationJob:
+        """
+        Restarts a failed, cancelled or interrupted job, or takes over one whose
+        worker is gone; completed files are skipped.
+        """
+        job = self.get_job(db, job_id)
+        if not job:
+            raise Exception("Job not found")
+        if job.status not in RESUMABLE_STATUSES and not self._abandoned(job, datetime.utcnow()):
+            raise Exception(f"Job is {job.status} and can't be resumed")
+        with self._lock:
+            self._local.add(job.id)
+        job.status = "pending"
+        job.worker = WORKER_ID
+        job.heartbeat_at = datetime.utcnow()
+        job.cancel_requested = 0
+        job.error = None
+        job.finished_at = None
+        db.commit()
+        self.submit(job.id)
+        db.refresh(job)
+        return job
+
+    def recover(self, db: Session) -> List[str]:
+        """
+        Marks jobs whose worker is gone (dead process or no heartbeat) as
+        interrupted. Returns their ids so the caller can resume them.
+        """
+        now = datetime.utcnow()
+        jobs = db.query(GenerationJob).filter(GenerationJob.status.in_(("pending", "running"))).all()
+        stale = []
+        for job in jobs:
+            if self._abandoned(job, now):
+                job.status = "interrupted"
+                stale.append(job.id)
+        db.commit()
+        return stale
+
+    def recover_stale(self):
+        """recover(), resuming the interrupted jobs on this worker with OMNIGEN_JOB_AUTO_RESUME."""
+        db = SessionLocal()
+        try:
+            for job_id in self.recover(db):
+                if JOB_AUTO_RESUME:
+                    self.resume(db, job_id)
+        except Exception as e:
+            print(f"Generation job recovery failed: {e}")
+        finally:
+            db.close()
+
+    def _abandoned(self, job: GenerationJob, now: datetime) -> bool:
+        """A queued or running job that no live worker is working on."""
+        if job.status not in ("pending", "running"):
+            return False
+        with self._lock:
+            if job.id in self._local:
+                return False
+        if job.worker == WORKER_ID or worker_is_dead(job.worker):
+            # Left behind by this process (e.g. before a restart with the same pid) or by a dead one
+            return True
+        last_seen = job.heartbeat_at or job.updated_at or job.created_at
+        return last_seen is None or last_seen < now - timedelta(seconds=JOB_STALE_AFTER)
+
+    def _heartbeat_loop(self):
+        while not self._heartbeat_stop.wait(JOB_HEARTBEAT_INTERVAL):
+            with self._lock:
+                local = list(self._local)
+            if local:
+                db = SessionLocal()
+                try:
+                    db.query(GenerationJob).filter(GenerationJob.id.in_(local)).update(
+                        {GenerationJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+                    )
+                    db.commit()
+                except Exception as e:
+                    print(f"Generation job heartbeat failed: {e}")
+                finally:
+                    db.close()
+            self.recover_stale()
+
+    def progress(self, db: Session, job_id: str, after_file_id: int = 0) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Returns the job state and the files recorded after `after_file_id`."""
+        job = self.get_job(db, job_id)
+        if not job:
+            return None, []
+        files = (
+            db.query(GenerationJobFile)
+            .filter(GenerationJobFile.job_id == job_id, GenerationJobFile.id > after_file_id)
+            .order_by(GenerationJobFile.id)
+            .all()
+        )
+        return job_to_dict(job), [job_file_to_dict(f) for f in files]
+
+    def shutdown(self):
+        # Running jobs stop at the next file and are left resumable
+        self._stopping = True
+        self._heartbeat_stop.set()
+        with self._lock:
+            for event in self._cancel_events.values():
+                event.set()
+        self._executor.shutdown(wait=False)
+
+    def _is_cancelled(self, db: Session, job_id: str) -> bool:
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if self._stopping or (event and event.is_set()):
+            return True
+        flag, status, worker = (
+            db.query(GenerationJob.cancel_requested, GenerationJob.status, GenerationJob.worker)
+            .filter(GenerationJob.id == job_id)
+            .one()
+        )
+        if status != "running" or worker != WORKER_ID:
+            raise JobLost()
+        return bool(flag)
+
+    def _run(self, job_id: str):
+        db = SessionLocal()
+        try:
+            # Claimed atomically, so a job resumed on two workers runs once
+            claimed = (
+                db.query(GenerationJob)
+                .filter(GenerationJob.id == job_id, GenerationJob.status == "pending")
+                .update({GenerationJob.status: "running", GenerationJob.worker: WORKER_ID,
+                         GenerationJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            )
+            db.commit()
+            if not claimed:
+                return
+            job = self.get_job(db, job_id)
+            try:
+                self._execute(db, job, json.loads(job.request_json))
+                job.status = "completed" if not job.failed else "failed"
+                if job.failed:
+                    job.error = f"{job.failed} files failed, resume the job to retry them"
+            except JobCancelled:
+                job.status = "interrupted" if self._stopping else "cancelled"
+            except JobLost:
+                # Whoever took the job over owns its state now
+                db.rollback()
+                print(f"Generation job {job_id} was taken over, stopping")
+                return
+            except Exception as e:
+                db.rollback()
+                job = self.get_job(db, job_id)
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            print(f"Generation job {job_id} crashed: {e}")
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._local.discard(job_id)
+            db.close()
+
+    def _execute(self, db: Session, job: GenerationJob, request: Dict[str, Any]):
+        group = generator_service.get_group_with_templates(db, request["template_group_id"])
+        if not group:
+            raise Exception("Template Group not found")
+        if not group.templates:
+            raise Exception("No templates in this group")
+        use_llm = request.get("use_llm", False)
+
+        schemas = db_service.get_table_schemas(
+            request["db_url"], request["selected_tables"], use_cache=not request.get("refresh_schema", False)
+        )
+        tables, _, config_id = snapshot_service.select_tables(
+            db, request["db_url"], request["selected_tables"], schemas,
+            request.get("datasource_id"), request.get("incremental", False)
+        )
+
+        # Files completed by an earlier attempt are skipped; failed ones are retried
+        done = set()
+        for f in list(job.files):
+            if f.status == "completed":
+                done.add((f.table_name, f.template_id))
+            else:
+                db.delete(f)
+        # Tables finished by an earlier attempt were snapshotted then, so an
+        # incremental resume no longer selects them; they still count toward the job
+        done_tables = {table for table, _ in done}
+        selected = set(tables) | done_tables
+        tables = [t for t in dict.fromkeys(request["selected_tables"]) if t in selected]
+        template_ids = {tmpl.id for tmpl in group.templates}
+        job.total = len(tables) * len(group.templates)
+        job.completed = len([key for key in done if key[0] in tables and key[1] in template_ids])
+        job.failed = 0
+        db.commit()
+
+        for table in tables:
+            context = schemas[table].copy()
+            context['TableName'] = table
+            table_failed = False
+
+            for tmpl in group.templates:
+                if (table, tmpl.id) in done:
+                    continue
+                if self._is_cancelled(db, job.id):
+                    raise JobCancelled()
+
+                started = time.perf_counter()
+                output = generator_service.resolve_output_path(tmpl, context)
+                record = GenerationJobFile(
+                    job_id=job.id, table_name=table, template_id=tmpl.id, path=output["full_path"]
+                )
+                try:
+                    code = self._render(db, tmpl, context, use_llm, not request.get("bypass_llm_cache", False),
+                                        request.get("llm_draft", False))
+                    record.write_status = generator_service.write_output(output["full_path"], code)
+                    record.status = "completed"
+                    job.completed += 1
+                except Exception as e:
+                    record.status = "failed"
+                    record.error = str(e)
+                    job.failed += 1
+                    table_failed = True
+                record.elapsed_ms = int((time.perf_counter() - started) * 1000)
+                db.add(record)
+                db.commit()
+
+            # Record the table as the baseline for the next incremental run
+            if config_id is not None and not table_failed:
+                snapshot_service.save(db, config_id, {table: schemas[table]})
+
+    def _render(self, db: Session, tmpl, context: Dict[str, Any], use_llm: bool, use_llm_cache: bool = True,
+                use_draft: bool = False) -> str:
+        if generator_service.uses_llm(tmpl, use_llm, use_draft):
+            return generator_service.generate_code(db, tmpl, context, use_llm=True, use_llm_cache=use_llm_cache,
+                                                   use_draft=use_draft)
+        key = generator_service.output_cache_key(tmpl, context)
+        code = generator_service.output_cache.get(key)
+        if code is None:
+            code = generator_service.render_content(tmpl, context)
+            generator_service.output_cache.put(key, code)
+        return code
+
+def job_to_dict(job: GenerationJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "completed": job.completed,
+        "failed": job.failed,
+        "cancel_requested": bool(job.cancel_requested),
+        "error": job.error,
+        "worker": job.worker,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+    }
+
+def job_file_to_dict(f: GenerationJobFile) -> Dict[str, Any]:
+    return {
+        "id": f.id,
+        "table": f.table_name,
+        "template_id": f.template_id,
+        "path": f.path,
+        "status": f.status,
+        "write_status": f.write_status,
+        "error": f.error,
+        "elapsed_ms": f.elapsed_ms,
+    }
+
+job_service = JobService()
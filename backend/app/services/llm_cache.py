@@ -0,0 +1,166 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app.models import LLMResponse, SessionLocal
+
+# Total size (in characters) of stored responses before the least recently used are evicted
+LLM_CACHE_MAX_BYTES = int(os.getenv("OMNIGEN_LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Set to 0 to turn the response cache off
+LLM_CACHE_ENABLED = os.getenv("OMNIGEN_LLM_CACHE", "1") != "0"
+# Stores between recounts of the stored size from the DB
+SIZE_RESYNC_PUTS = 100
+# Eviction frees space down to this fraction of the maximum, so the next stores don't evict again
+EVICT_TO_FRACTION = 0.9
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def response_key(provider: str, model: str, system_prompt: str, prompt: str) -> str:
+    payload = "\0".join([provider or "", model or "", system_prompt, prompt_hash(prompt)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    Completions of temperature 0 requests, persisted in the app DB and keyed
+    by (provider, model, system prompt, rendered prompt hash). The total
+    stored size is bounded; the least recently used responses go first.
+    """
+    def __init__(self, max_bytes: int = LLM_CACHE_MAX_BYTES, enabled: bool = LLM_CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # Running estimate of the stored size, so a store doesn't sum the table;
+        # resynced with the DB (other workers store too) every SIZE_RESYNC_PUTS stores
+        self._size: Optional[int] = None
+        self._puts_since_sync = 0
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMResponse).filter(LLMResponse.id == key).first()
+            if entry is None:
+                self._count("misses")
+                return None
+            entry.hits = (entry.hits or 0) + 1
+            entry.last_used_at = datetime.utcnow()
+            content = entry.content
+            db.commit()
+            self._count("hits")
+            return content
+        except Exception as e:
+            print(f"LLM response cache lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def put(self, key: str, provider: str, model: str, prompt: str, content: str):
+        if not self.enabled or not content or len(content) > self.max_bytes:
+            return
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMResponse).filter(LLMResponse.id == key).first()
+            added = len(content)
+            if entry is None:
+                entry = LLMResponse(id=key, provider=provider or "", model_name=model or "", prompt_hash=prompt_hash(prompt))
+                db.add(entry)
+            else:
+                added -= entry.size or 0
+            entry.content = content
+            entry.size = len(content)
+            entry.last_used_at = datetime.utcnow()
+            db.commit()
+            self._count("stores")
+            if self._grow(added):
+                self._evict(db)
+        except IntegrityError:
+            # A concurrent insert of the same key; the other writer's copy wins
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            print(f"LLM response cache store failed: {e}")
+        finally:
+            db.close()
+
+    def _grow(self, added: int) -> bool:
+        """Adds a store to the size estimate. True when the stored size has to be checked."""
+        with self._lock:
+            self._puts_since_sync += 1
+            if self._size is None or self._puts_since_sync >= SIZE_RESYNC_PUTS:
+                return True
+            self._size += added
+            return self._size > self.max_bytes
+
+    def _evict(self, db):
+        total = db.query(func.coalesce(func.sum(LLMResponse.size), 0)).scalar() or 0
+        with self._lock:
+            self._size = total
+            self._puts_since_sync = 0
+        if total <= self.max_bytes:
+            return
+        victims = []
+        target = int(self.max_bytes * EVICT_TO_FRACTION)
+        for entry_id, size in db.query(LLMResponse.id, LLMResponse.size).order_by(LLMResponse.last_used_at).yield_per(500):
+            if total <= target:
+                break
+            victims.append(entry_id)
+            total -= size or 0
+        for i in range(0, len(victims), 500):
+            db.query(LLMResponse).filter(LLMResponse.id.in_(victims[i:i + 500])).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self._size = total
+        self._count("evictions", len(victims))
+
+    def delete(self, key: str) -> bool:
+        """Drops one stored response, e.g. one that turned out to be unusable."""
+        if not self.enabled:
+            return False
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMResponse).filter(LLMResponse.id == key).first()
+            if entry is None:
+                return False
+            size = entry.size or 0
+            db.delete(entry)
+            db.commit()
+            with self._lock:
+                if self._size is not None:
+                    self._size -= size
+            return True
+        except Exception as e:
+            db.rollback()
+            print(f"LLM response cache delete failed: {e}")
+            return False
+        finally:
+            db.close()
+
+    def clear(self) -> int:
+        db = SessionLocal()
+        try:
+            removed = db.query(LLMResponse).delete()
+            db.commit()
+            with self._lock:
+                self._size = 0
+            return removed
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            entries, size = db.query(func.count(LLMResponse.id), func.coalesce(func.sum(LLMResponse.size), 0)).one()
+        finally:
+            db.close()
+        with self._lock:
+            return {**self._stats, "entries": entries, "bytes": size, "max_bytes": self.max_bytes, "enabled": self.enabled}
@@ -0,0 +1,184 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+import openai
+from app.models import LLMConfig
+
+# Attempts per request across the pool, and the base/maximum backoff between them (seconds)
+LLM_MAX_ATTEMPTS = int(os.getenv("OMNIGEN_LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("OMNIGEN_LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_BACKOFF_MAX = float(os.getenv("OMNIGEN_LLM_RETRY_BACKOFF_MAX", "8"))
+# A backend failing this many times in a row is skipped for LLM_UNHEALTHY_COOLDOWN seconds
+LLM_UNHEALTHY_AFTER = int(os.getenv("OMNIGEN_LLM_UNHEALTHY_AFTER", "3"))
+LLM_UNHEALTHY_COOLDOWN = float(os.getenv("OMNIGEN_LLM_UNHEALTHY_COOLDOWN", "30"))
+# Concurrent completions per config when its max_concurrency isn't set
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("OMNIGEN_LLM_MAX_CONCURRENCY", "4"))
+# Prompt prefixes remembered for backend affinity
+LLM_AFFINITY_SIZE = int(os.getenv("OMNIGEN_LLM_AFFINITY_SIZE", "10000"))
+# Weight of the newest sample in the latency moving averages
+LATENCY_EWMA_ALPHA = 0.2
+# Per-call timings kept as moving averages per backend, so regressions show quickly
+METRIC_AVERAGES = ("queue_wait_ms", "ttft_ms", "total_ms", "tokens_per_s")
+
+def ewma(average: Optional[float], sample: float) -> float:
+    if average is None:
+        return float(sample)
+    return LATENCY_EWMA_ALPHA * sample + (1 - LATENCY_EWMA_ALPHA) * average
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors, timeouts and connection failures are worth another backend."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+class BackendState:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.latency_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # Completed calls: token totals and moving averages of their timings
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.averages: Dict[str, float] = {}
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+class LLMRouter:
+    """
+    Spreads requests over the LLMConfig rows of a pool: least outstanding
+    requests first, preferring the backend that last served the same prompt
+    prefix while it has a free slot (its KV cache holds that prefix).
+    Backends that keep failing are skipped for a cooldown (circuit breaker).
+    """
+    def __init__(self):
+        self._states: Dict[int, BackendState] = {}
+        self._affinity: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, config_id: int) -> BackendState:
+        state = self._states.get(config_id)
+        if state is None:
+            state = self._states[config_id] = BackendState()
+        return state
+
+    def acquire(self, backends: List[LLMConfig], tried: Set[int], affinity_key: Optional[str] = None) -> LLMConfig:
+        """Picks a backend for one attempt and counts it as outstanding until release()."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in backends if b.id not in tried] or backends
+            healthy = [b for b in candidates if self._state(b.id).healthy(now)]
+            if healthy:
+                candidates = healthy
+            else:
+                # Everything is cooling down; try the one that recovers first
+                candidates = [min(candidates, key=lambda b: self._state(b.id).unhealthy_until)]
+
+            chosen = None
+            preferred = self._affinity.get(affinity_key) if affinity_key else None
+            for b in candidates:
+                if b.id == preferred and self._state(b.id).in_flight < (b.max_concurrency or DEFAULT_MAX_CONCURRENCY):
+                    chosen = b
+                    break
+            if chosen is None:
+                chosen = min(candidates, key=lambda b: (self._state(b.id).in_flight, self._state(b.id).latency_ms or 0.0))
+
+            self._state(chosen.id).in_flight += 1
+            if affinity_key:
+                self._affinity[affinity_key] = chosen.id
+                self._affinity.move_to_end(affinity_key)
+                while len(self._affinity) > LLM_AFFINITY_SIZE:
+                    self._affinity.popitem(last=False)
+            return chosen
+
+    def release(self, config: LLMConfig, latency: Optional[float] = None, error: Optional[BaseException] = None,
+                cancelled: bool = False):
+        """Ends an attempt; latency is in seconds. Cancelled attempts say nothing about the backend."""
+        with self._lock:
+            state = self._state(config.id)
+            state.in_flight = max(0, state.in_flight - 1)
+            if not cancelled:
+                self._record(state, latency, error)
+
+    def record(self, config: LLMConfig, latency: Optional[float] = None, error: Optional[BaseException] = None):
+        """Records the outcome of a health check."""
+        with self._lock:
+            self._record(self._state(config.id), latency, error)
+
+    def mark_unhealthy(self, config: LLMConfig, error: BaseException):
+        """Takes a backend out of rotation for a cooldown at once, e.g. when it can't be used as configured."""
+        with self._lock:
+            state = self._state(config.id)
+            state.requests += 1
+            state.failures += 1
+            state.last_error = str(error)[:500]
+            state.unhealthy_until = time.monotonic() + LLM_UNHEALTHY_COOLDOWN
+
+    def _record(self, state: BackendState, latency: Optional[float], error: Optional[BaseException]):
+        state.requests += 1
+        if error is None:
+            state.consecutive_failures = 0
+            state.unhealthy_until = 0.0
+            if latency is not None:
+                state.latency_ms = ewma(state.latency_ms, latency * 1000)
+            return
+        state.failures += 1
+        state.last_error = str(error)[:500]
+        # Only backend trouble counts towards the circuit breaker, not bad requests
+        if is_retryable(error):
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= LLM_UNHEALTHY_AFTER:
+                state.unhealthy_until = time.monotonic() + LLM_UNHEALTHY_COOLDOWN
+
+    def observe(self, config: LLMConfig, metrics: Dict[str, Any]):
+        """Adds a completed call's tokens and timings (see call_metrics) to the backend's stats."""
+        with self._lock:
+            state = self._state(config.id)
+            state.calls += 1
+            state.prompt_tokens += metrics.get("prompt_tokens", 0)
+            state.completion_tokens += metrics.get("completion_tokens", 0)
+            state.cached_tokens += metrics.get("cached_tokens", 0)
+            for name in METRIC_AVERAGES:
+                if metrics.get(name) is not None:
+                    state.averages[name] = ewma(state.averages.get(name), metrics[name])
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Exponential backoff with jitter; a 429's Retry-After is honoured up to the maximum."""
+        delay = min(LLM_RETRY_BACKOFF * (2 ** attempt), LLM_RETRY_BACKOFF_MAX)
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_RETRY_BACKOFF_MAX)
+            except ValueError:
+                pass
+        return delay * random.uniform(0.5, 1.0)
+
+    def stats(self, config_id: int) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(config_id)
+            return {
+                "in_flight": state.in_flight,
+                "requests": state.requests,
+                "failures": state.failures,
+                "healthy": state.healthy(now),
+                "latency_ms": round(state.latency_ms, 2) if state.latency_ms is not None else None,
+                "last_error": state.last_error,
+                "calls": state.calls,
+                "prompt_tokens": state.prompt_tokens,
+                "completion_tokens": state.completion_tokens,
+                "cached_tokens": state.cached_tokens,
+                **{name: round(state.averages[name], 2) if name in state.averages else None
+                   for name in METRIC_AVERAGES},
+            }
@@ -1,17 +1,312 @@
+import asyncio
+import importlib.util
 import json
-from typing import Optional, Dict, Any, Generator
+import os
+import re
+import threading
+import time
+import httpx
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, Generator, AsyncGenerator, List, Tuple
 from sqlalchemy.orm import Session
 from app.models import LLMConfig
-from openai import OpenAI
+from app.services.llm_cache import LLMResponseCache, response_key
+from app.services.llm_router import DEFAULT_MAX_CONCURRENCY, LLM_MAX_ATTEMPTS, LLMRouter, is_retryable
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+SYSTEM_PROMPT = "You are an expert Java/Spring Boot developer. Output only the code, no markdown code blocks, no explanations."
+
+# Keep-alive connections kept open per LLM backend, and how long an idle one lives
+LLM_MAX_KEEPALIVE = int(os.getenv("OMNIGEN_LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("OMNIGEN_LLM_KEEPALIVE_EXPIRY", "60"))
+# The active config is re-read after this long even without invalidation (other workers)
+LLM_CONFIG_TTL = float(os.getenv("OMNIGEN_LLM_CONFIG_TTL", "30"))
+# Cached responses are replayed to streaming callers in chunks of this many characters
+LLM_REPLAY_CHUNK_SIZE = int(os.getenv("OMNIGEN_LLM_REPLAY_CHUNK_SIZE", "1024"))
+# Ask for usage in the final stream chunk (stream_options.include_usage) to report cached tokens
+LLM_STREAM_USAGE = os.getenv("OMNIGEN_LLM_STREAM_USAGE", "1") != "0"
+# How long requests sharing a prompt prefix wait for the first one to be prefilled (0 disables)
+LLM_PREFIX_WARMUP_WAIT = float(os.getenv("OMNIGEN_LLM_PREFIX_WARMUP_WAIT", "10"))
+LLM_HEALTH_CHECK_TIMEOUT = float(os.getenv("OMNIGEN_LLM_HEALTH_CHECK_TIMEOUT", "5"))
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+def clean_completion(content: Optional[str]) -> str:
+    """Strips <think> blocks (DeepSeek R1 style) and markdown code fences."""
+    content = re.sub(r'<think>.*?</think>', '', content or '', flags=re.DOTALL).strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[1] if "\n" in content else ""
+        if content.endswith("```"):
+            content = content.rsplit("```", 1)[0]
+    return content.strip()
+
+def extract_usage(usage: Any) -> Dict[str, int]:
+    """
+    Token counts from a completion's usage. Cached prompt tokens are reported
+    as prompt_tokens_details.cached_tokens (OpenAI, vLLM) or
+    prompt_cache_hit_tokens (DeepSeek).
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    result = {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": cached or 0,
+    }
+    # Predicted outputs: how much of the prediction the model kept
+    completion_details = getattr(usage, "completion_tokens_details", None)
+    for name in ("accepted_prediction_tokens", "rejected_prediction_tokens"):
+        value = getattr(completion_details, name, None) if completion_details is not None else None
+        if value:
+            result[name] = value
+    return result
+
+def call_metrics(queued: float, sent: float, first_token: Optional[float], finished: float,
+                 completion_tokens: int = 0) -> Dict[str, Any]:
+    """
+    Timings of one upstream call from perf_counter() readings: queue wait
+    (limiter, prefix warm-up and failed attempts), time to first token
+    (prefill), total latency and the decode rate in tokens per second.
+    """
+    first_token = finished if first_token is None else first_token
+    generation = finished - first_token
+    return {
+        "queue_wait_ms": round((sent - queued) * 1000, 2),
+        "ttft_ms": round((first_token - sent) * 1000, 2),
+        "generation_ms": round(generation * 1000, 2),
+        "total_ms": round((finished - queued) * 1000, 2),
+        "tokens_per_s": round(completion_tokens / generation, 2) if completion_tokens and generation > 0 else None,
+    }
+
+def add_usage(totals: Dict[str, Any], usage: Optional[Dict[str, Any]]):
+    """
+    Adds a call's usage to run totals; coalesced and cached responses cost
+    nothing. Timings are summed, with per-call averages alongside.
+    """
+    if not usage or usage.get("coalesced") or usage.get("response_cache"):
+        return
+    for name in ("prompt_tokens", "completion_tokens", "cached_tokens", "schema_tokens_saved",
+                 "accepted_prediction_tokens", "rejected_prediction_tokens"):
+        totals[name] = totals.get(name, 0) + usage.get(name, 0)
+    if "total_ms" not in usage:
+        return
+    calls = totals["calls"] = totals.get("calls", 0) + 1
+    for name in ("queue_wait_ms", "ttft_ms", "generation_ms", "total_ms"):
+        totals[name] = round(totals.get(name, 0) + usage[name], 2)
+        totals[f"avg_{name}"] = round(totals[name] / calls, 2)
+    totals["max_total_ms"] = max(totals.get("max_total_ms", 0), usage["total_ms"])
+    totals["tokens_per_s"] = (
+        round(totals["completion_tokens"] * 1000 / totals["generation_ms"], 2) if totals["generation_ms"] else None
+    )
+
+class LLMClientPool:
+    """
+    Reuses OpenAI clients, and with them their keep-alive connection pools,
+    per (base_url, api_key, model). Async clients are tied to the event loop
+    that created their connections, so a new loop gets its own client.
+    """
+    def __init__(self):
+        self._sync: Dict[Tuple[str, str, str], OpenAI] = {}
+        self._async: Dict[Tuple[str, str, str], Tuple[asyncio.AbstractEventLoop, AsyncOpenAI]] = {}
+        # Replaced async clients whose loop is stopped, closed on that loop at shutdown
+        self._stale: List[Tuple[asyncio.AbstractEventLoop, AsyncOpenAI]] = []
+        self._lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_keepalive_connections=LLM_MAX_KEEPALIVE, keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+
+    def get(self, options: Dict[str, Any], model: str) -> OpenAI:
+        key = (options["base_url"], options["api_key"], model)
+        with self._lock:
+            client = self._sync.get(key)
+            if client is None:
+                print(f"DEBUG: Initializing OpenAI Client with base_url='{key[0]}', model='{model}'")
+                http_client = httpx.Client(http2=HTTP2_AVAILABLE, limits=self._limits(), timeout=options["timeout"])
+                client = OpenAI(**options, http_client=http_client)
+                self._sync[key] = client
+            return client
+
+    def get_async(self, options: Dict[str, Any], model: str) -> AsyncOpenAI:
+        key = (options["base_url"], options["api_key"], model)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._async.get(key)
+            if entry is None or entry[0] is not loop:
+                if entry is not None:
+                    self._retire(*entry)
+                print(f"DEBUG: Initializing AsyncOpenAI Client with base_url='{key[0]}', model='{model}'")
+                http_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=self._limits(), timeout=options["timeout"])
+                entry = (loop, AsyncOpenAI(**options, http_client=http_client))
+                self._async[key] = entry
+            return entry[1]
+
+    def _retire(self, loop: asyncio.AbstractEventLoop, client: AsyncOpenAI):
+        """
+        Drops a client of another event loop. It is closed on that loop right
+        away while the loop runs, or at shutdown if the loop is only stopped.
+        A closed loop can't close it any more; its sockets go with the client.
+        """
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+        elif not loop.is_closed():
+            self._stale.append((loop, client))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sync_clients": len(self._sync), "async_clients": len(self._async), "http2": HTTP2_AVAILABLE}
+
+    async def aclose(self):
+        """Closes every client, each async one on the loop that owns its connections."""
+        with self._lock:
+            sync_clients = list(self._sync.values())
+            async_clients = list(self._async.values()) + self._stale
+            self._sync.clear()
+            self._async.clear()
+            self._stale = []
+        for client in sync_clients:
+            client.close()
+        current = asyncio.get_running_loop()
+        for loop, client in async_clients:
+            if loop is current:
+                await client.close()
+            elif loop.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.close(), loop))
+            elif not loop.is_closed():
+                await asyncio.to_thread(loop.run_until_complete, client.close())
+
+class StreamFlight:
+    """
+    One upstream completion shared by every concurrent caller with the same
+    prompt key. Chunks are kept, so a late subscriber first catches up and
+    then follows the live stream.
+    """
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.usage: Dict[str, Any] = {}
+        self.task: Optional[asyncio.Future] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: Optional[str] = None, done: bool = False, error: Optional[BaseException] = None):
+        if chunk is not None:
+            self.chunks.append(chunk)
+        if done or error is not None:
+            self.done = True
+            self.error = error
+        # Wake everyone waiting on the current event; later waits use a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        i = 0
+        while True:
+            if i < len(self.chunks):
+                i += 1
+                yield self.chunks[i - 1]
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
 
 class LLMService:
     def __init__(self):
-        pass
+        # Per-config semaphores bounding in-flight async completions: id -> (loop, limit, semaphore)
+        self._limiters: Dict[int, Tuple[asyncio.AbstractEventLoop, int, asyncio.Semaphore]] = {}
+        # The same bound for completions made from worker threads (jobs): id -> (limit, semaphore)
+        self._sync_limiters: Dict[int, Tuple[int, threading.BoundedSemaphore]] = {}
+        self._sync_limiters_lock = threading.Lock()
+        self.clients = LLMClientPool()
+        self.response_cache = LLMResponseCache()
+        # In-flight upstream completions by prompt key (single-flight)
+        self._flights: Dict[str, StreamFlight] = {}
+        # Shared prompt prefixes currently being prefilled: prefix key -> (loop, event)
+        self._warming: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+        self._sync_flights: Dict[str, Future] = {}
+        self._sync_flights_lock = threading.Lock()
+        self.router = LLMRouter()
+        # Detached copies of the active config and its pool members, and when they were loaded
+        self._backends: List[LLMConfig] = []
+        self._backends_loaded_at: Optional[float] = None
+        self._config_lock = threading.Lock()
+
+    def get_backends(self, db: Session) -> List[LLMConfig]:
+        """
+        Returns the active config followed by the other members of its pool
+        (same pool_name), cached until invalidate_config() or LLM_CONFIG_TTL.
+        Empty when no config is active.
+        """
+        with self._config_lock:
+            loaded_at = self._backends_loaded_at
+            if loaded_at is not None and time.monotonic() - loaded_at < LLM_CONFIG_TTL:
+                return self._backends
+        active = db.query(LLMConfig).filter(LLMConfig.is_active == 1).first()
+        configs = [active] if active is not None else []
+        if active is not None and active.pool_name:
+            configs += (
+                db.query(LLMConfig)
+                .filter(LLMConfig.pool_name == active.pool_name, LLMConfig.id != active.id)
+                .order_by(LLMConfig.id)
+                .all()
+            )
+        # Transient copies stay readable after the request's session is closed
+        backends = [LLMConfig(**{c.name: getattr(config, c.name) for c in LLMConfig.__table__.columns}) for config in configs]
+        with self._config_lock:
+            self._backends = backends
+            self._backends_loaded_at = time.monotonic()
+        return backends
 
     def get_active_config(self, db: Session) -> Optional[LLMConfig]:
-        return db.query(LLMConfig).filter(LLMConfig.is_active == 1).first()
+        """Returns the active config; it also identifies its pool for caching and coalescing."""
+        backends = self.get_backends(db)
+        return backends[0] if backends else None
 
-    def _get_client(self, config: LLMConfig) -> OpenAI:
+    def max_concurrency(self, db: Session) -> int:
+        """Completions the active pool runs at once, summed over its backends (0 when none is active)."""
+        return sum(max(1, b.max_concurrency or DEFAULT_MAX_CONCURRENCY) for b in self.get_backends(db))
+
+    def invalidate_config(self):
+        """Called whenever an LLM config is created, updated or deleted."""
+        with self._config_lock:
+            self._backends = []
+            self._backends_loaded_at = None
+
+    def backend_stats(self, config_id: int) -> Dict[str, Any]:
+        return self.router.stats(config_id)
+
+    async def check_health(self, db: Session) -> Dict[int, Dict[str, Any]]:
+        """Probes every LLM config (GET /models) and updates its health."""
+        async def probe(config: LLMConfig):
+            started = time.perf_counter()
+            try:
+                client = self._get_async_client(config)
+            except Exception as e:
+                # Misconfigured, e.g. no API key; every request would fail
+                self.router.mark_unhealthy(config, e)
+                return
+            try:
+                await asyncio.wait_for(client.models.list(), LLM_HEALTH_CHECK_TIMEOUT)
+                self.router.record(config, latency=time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                self.router.record(config, error=openai.APITimeoutError(request=httpx.Request("GET", config.base_url)))
+            except Exception as e:
+                self.router.record(config, error=e)
+
+        configs = db.query(LLMConfig).order_by(LLMConfig.id).all()
+        await asyncio.gather(*[probe(config) for config in configs])
+        return {config.id: self.router.stats(config.id) for config in configs}
+
+    async def shutdown(self):
+        await self.clients.aclose()
+
+    def _client_options(self, config: LLMConfig) -> Dict[str, Any]:
         # Prepare client
         api_key = config.api_key
         if not api_key:
@@ -25,78 +320,439 @@ class LLMService:
         base_url = config.base_url.strip().rstrip('/')
         if base_url.endswith("/chat/completions"):
             base_url = base_url.replace("/chat/completions", "")
-        
-        print(f"DEBUG: Initializing OpenAI Client with base_url='{base_url}', model='{config.model_name}'")
 
-        return OpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            timeout=600.0
-        )
+        # Retries are done by the router, possibly on another backend of the pool
+        return {"api_key": api_key, "base_url": base_url, "timeout": 600.0, "max_retries": 0}
+
+    def _get_client(self, config: LLMConfig) -> OpenAI:
+        return self.clients.get(self._client_options(config), config.model_name)
+
+    def _get_async_client(self, config: LLMConfig) -> AsyncOpenAI:
+        return self.clients.get_async(self._client_options(config), config.model_name)
+
+    def _prediction_options(self, config: LLMConfig, prediction: Optional[str]) -> Dict[str, Any]:
+        """Request options sending the expected output as a predicted output, where the backend supports it."""
+        if not prediction or not config.predicted_outputs:
+            return {}
+        return {"prediction": {"type": "content", "content": prediction}}
+
+    def _messages(self, prompt: str, context: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        System prompt, then the shared context (e.g. a table's schema), then the
+        request-specific prompt. Requests sharing a context share a token prefix
+        that vLLM, Ollama and hosted providers can serve from their prompt cache.
+        """
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if context:
+            messages.append({"role": "user", "content": context})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def limiter(self, config: LLMConfig) -> asyncio.Semaphore:
+        """
+        Returns the semaphore bounding concurrent completions against a config,
+        so concurrent file generation keeps the backend busy without overloading it.
+        """
+        limit = max(1, config.max_concurrency or DEFAULT_MAX_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+        entry = self._limiters.get(config.id)
+        if entry is None or entry[0] is not loop or entry[1] != limit:
+            entry = (loop, limit, asyncio.Semaphore(limit))
+            self._limiters[config.id] = entry
+        return entry[2]
+
+    def sync_limiter(self, config: LLMConfig) -> threading.BoundedSemaphore:
+        """
+        Thread counterpart of limiter() for the blocking completion calls. It is
+        a separate budget, so a backend serving both jobs and async requests may
+        see up to twice its max_concurrency.
+        """
+        limit = max(1, config.max_concurrency or DEFAULT_MAX_CONCURRENCY)
+        with self._sync_limiters_lock:
+            entry = self._sync_limiters.get(config.id)
+            if entry is None or entry[0] != limit:
+                entry = (limit, threading.BoundedSemaphore(limit))
+                self._sync_limiters[config.id] = entry
+            return entry[1]
+
+    def _cache_key(self, config: LLMConfig, prompt: str, context: Optional[str] = None) -> str:
+        return response_key(config.provider, config.model_name, SYSTEM_PROMPT, f"{context or ''}\0{prompt}")
+
+    def _store(self, config: LLMConfig, key: str, prompt: str, content: str):
+        self.response_cache.put(key, config.provider, config.model_name, prompt, content)
 
-    def chat_completion(self, db: Session, prompt: str) -> str:
+    def _replay(self, content: str) -> Generator[str, None, None]:
+        for i in range(0, len(content), LLM_REPLAY_CHUNK_SIZE):
+            yield content[i:i + LLM_REPLAY_CHUNK_SIZE]
+
+    def chat_completion(self, db: Session, prompt: str, use_cache: bool = True, context: Optional[str] = None,
+                        prediction: Optional[str] = None) -> str:
+        """
+        Completes a prompt. Responses are cached (requests use temperature 0);
+        use_cache=False skips the lookup but still stores the fresh response.
+        `prediction` is the expected output (a draft), sent as a predicted
+        output to backends that support it.
+        """
         config = self.get_active_config(db)
         if not config:
             raise Exception("No active LLM configuration found. Please configure LLM in settings.")
 
-        client = self._get_client(config)
+        key = self._cache_key(config, prompt, context)
+        cached = self.response_cache.get(key) if use_cache else None
+        if cached is not None:
+            return clean_completion(cached)
+
+        # Concurrent threads asking for the same prompt wait for the first one's call
+        with self._sync_flights_lock:
+            flight = self._sync_flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._sync_flights[key] = flight
+        if not leader:
+            return clean_completion(flight.result())
 
         try:
-            # DeepSeek / OpenAI Call
-            response = client.chat.completions.create(
-                model=config.model_name,
-                messages=[
-                    {"role": "system", "content": "You are an expert Java/Spring Boot developer. Output only the code, no markdown code blocks, no explanations."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,
-                stream=False
-            )
-            
-            content = response.choices[0].message.content
-            
-            # Strip <think> tags if present (DeepSeek R1 style)
-            import re
-            content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
-            
-            # Strip markdown code blocks if present
-            if content.startswith("```"):
-                content = content.split("\n", 1)[1]
-                if content.endswith("```"):
-                    content = content.rsplit("```", 1)[0]
-            
-            return content.strip()
-            
+            # DeepSeek / OpenAI Call, failing over across the pool
+            content = self._complete_with_failover(self.get_backends(db), prompt, context, prediction)
+            self._store(config, key, prompt, content)
+            flight.set_result(content)
+        except Exception as e:
+            error = Exception(f"LLM Call Failed: {str(e)}")
+            flight.set_exception(error)
+            raise error
+        finally:
+            with self._sync_flights_lock:
+                self._sync_flights.pop(key, None)
+
+        return clean_completion(content)
+
+    def _complete_with_failover(self, backends: List[LLMConfig], prompt: str, context: Optional[str],
+                                prediction: Optional[str] = None) -> str:
+        tried = set()
+        error = None
+        affinity = self._affinity_key(backends[0], context)
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            if tried and len(tried) >= len(backends):
+                time.sleep(self.router.backoff(attempt - 1, error))
+            config = self.router.acquire(backends, tried, affinity)
+            started = time.perf_counter()
+            try:
+                with self.sync_limiter(config):
+                    sent = time.perf_counter()
+                    response = self._get_client(config).chat.completions.create(
+                        model=config.model_name,
+                        messages=self._messages(prompt, context),
+                        temperature=0.0,
+                        stream=False,
+                        **self._prediction_options(config, prediction)
+                    )
+            except Exception as e:
+                self.router.release(config, error=e)
+                if not is_retryable(e) or attempt == LLM_MAX_ATTEMPTS - 1:
+                    raise
+                print(f"LLM backend {config.name} failed ({e}), retrying")
+                tried.add(config.id)
+                error = e
+                continue
+            finished = time.perf_counter()
+            self.router.release(config, latency=finished - started)
+            usage = extract_usage(response.usage) if response.usage is not None else {}
+            usage.update(call_metrics(started, sent, None, finished, usage.get("completion_tokens", 0)))
+            self.router.observe(config, usage)
+            return response.choices[0].message.content or ""
+
+    def chat_completion_stream(self, db: Session, prompt: str, use_cache: bool = True, context: Optional[str] = None,
+                               prediction: Optional[str] = None) -> Generator[str, None, None]:
+        config = self.get_active_config(db)
+        if not config:
+            raise Exception("No active LLM configuration found.")
+
+        # A cached response is replayed in chunks, like a live stream
+        key = self._cache_key(config, prompt, context)
+        cached = self.response_cache.get(key) if use_cache else None
+        if cached is not None:
+            yield from self._replay(cached)
+            return
+
+        backends = self.get_backends(db)
+        affinity = self._affinity_key(config, context)
+        tried = set()
+        error = None
+        parts = []
+        usage = {}
+        queued = time.perf_counter()
+        first_token = None
+        options = {"stream_options": {"include_usage": True}} if LLM_STREAM_USAGE else {}
+
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            if tried and len(tried) >= len(backends):
+                time.sleep(self.router.backoff(attempt - 1, error))
+            backend = self.router.acquire(backends, tried, affinity)
+            started = time.perf_counter()
+            try:
+                with self.sync_limiter(backend):
+                    sent = time.perf_counter()
+                    stream = self._get_client(backend).chat.completions.create(
+                        model=backend.model_name,
+                        messages=self._messages(prompt, context),
+                        temperature=0.0,
+                        stream=True,
+                        **options,
+                        **self._prediction_options(backend, prediction)
+                    )
+
+                    # We need to handle <think> tags in stream, which is hard.
+                    # For now, we yield everything, but maybe frontend can hide <think>?
+                    # Or we try to buffer simple logic.
+                    # Let's yield raw chunks for now.
+                    try:
+                        for chunk in stream:
+                            if chunk.usage is not None:
+                                usage = extract_usage(chunk.usage)
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                if first_token is None:
+                                    first_token = time.perf_counter()
+                                parts.append(chunk.choices[0].delta.content)
+                                yield chunk.choices[0].delta.content
+                    finally:
+                        # Also reached when the consumer closes us (client disconnected);
+                        # closing the response stops the provider from generating further
+                        stream.close()
+            except Exception as e:
+                self.router.release(backend, error=e)
+                # Once output was passed on, another backend can't take over
+                if parts or not is_retryable(e) or attempt == LLM_MAX_ATTEMPTS - 1:
+                    raise Exception(f"LLM Stream Failed: {str(e)}")
+                print(f"LLM backend {backend.name} failed ({e}), retrying")
+                tried.add(backend.id)
+                error = e
+                continue
+            except BaseException:
+                self.router.release(backend, cancelled=True)
+                raise
+            finished = time.perf_counter()
+            self.router.release(backend, latency=finished - started)
+            usage.update(call_metrics(queued, sent, first_token, finished, usage.get("completion_tokens", 0)))
+            self.router.observe(backend, usage)
+            break
+
+        # Only complete streams get here; abandoned ones are never cached
+        self._store(config, key, prompt, "".join(parts))
+
+    def _affinity_key(self, config: LLMConfig, context: Optional[str]) -> Optional[str]:
+        """Requests sharing a context go to the same backend when it has room (its KV cache)."""
+        if not context:
+            return None
+        return response_key(config.provider, config.model_name, SYSTEM_PROMPT, context)
+
+    async def achat_completion(self, db: Session, prompt: str, use_cache: bool = True, context: Optional[str] = None,
+                               usage: Optional[Dict[str, Any]] = None, prediction: Optional[str] = None) -> str:
+        """
+        Async variant of chat_completion, bounded by the config's max_concurrency.
+        Token usage and timings of the call are written into `usage` when given.
+        """
+        config = self.get_active_config(db)
+        if not config:
+            raise Exception("No active LLM configuration found. Please configure LLM in settings.")
+
+        key = self._cache_key(config, prompt, context)
+        cached = await asyncio.to_thread(self.response_cache.get, key) if use_cache else None
+        if cached is not None:
+            if usage is not None:
+                usage["response_cache"] = True
+            return clean_completion(cached)
+
+        try:
+            content = "".join([
+                chunk async for chunk in self._join_flight(self.get_backends(db), key, prompt, context, usage, prediction)
+            ])
         except Exception as e:
             raise Exception(f"LLM Call Failed: {str(e)}")
+        return clean_completion(content)
 
-    def chat_completion_stream(self, db: Session, prompt: str) -> Generator[str, None, None]:
+    async def adiscard_response(self, db: Session, prompt: str, context: Optional[str] = None):
+        """Removes the cached response to a prompt, so the next call asks the LLM again."""
+        config = self.get_active_config(db)
+        if config is None:
+            return
+        key = self._cache_key(config, prompt, context)
+        flight = self._flights.get(key)
+        if flight is not None and flight.loop is asyncio.get_running_loop():
+            # Its callers got the response before it was stored; delete it after
+            await asyncio.wait([flight.task])
+        await asyncio.to_thread(self.response_cache.delete, key)
+
+    async def achat_completion_stream(self, db: Session, prompt: str, use_cache: bool = True, context: Optional[str] = None,
+                                      usage: Optional[Dict[str, Any]] = None,
+                                      prediction: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        Async variant of chat_completion_stream. Identical concurrent requests
+        share one upstream stream, and each caller receives every chunk.
+        Token usage and timings are written into `usage` once the stream completes.
+        """
         config = self.get_active_config(db)
         if not config:
             raise Exception("No active LLM configuration found.")
 
-        client = self._get_client(config)
+        key = self._cache_key(config, prompt, context)
+        cached = await asyncio.to_thread(self.response_cache.get, key) if use_cache else None
+        if cached is not None:
+            if usage is not None:
+                usage["response_cache"] = True
+            for chunk in self._replay(cached):
+                yield chunk
+            return
 
         try:
-            stream = client.chat.completions.create(
-                model=config.model_name,
-                messages=[
-                    {"role": "system", "content": "You are an expert Java/Spring Boot developer. Output only the code, no markdown code blocks, no explanations."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,
-                stream=True
-            )
-            
-            # We need to handle <think> tags in stream, which is hard.
-            # For now, we yield everything, but maybe frontend can hide <think>?
-            # Or we try to buffer simple logic.
-            # Let's yield raw chunks for now.
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                    
+            async for chunk in self._join_flight(self.get_backends(db), key, prompt, context, usage, prediction):
+                yield chunk
         except Exception as e:
             raise Exception(f"LLM Stream Failed: {str(e)}")
 
+    async def _join_flight(self, backends: List[LLMConfig], key: str, prompt: str, context: Optional[str],
+                           usage: Optional[Dict[str, Any]] = None,
+                           prediction: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        Subscribes to the in-flight completion for key, starting it if there is
+        none. The upstream call is cancelled once its last subscriber leaves.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None or flight.loop is not asyncio.get_running_loop()
+        if leader:
+            flight = StreamFlight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._run_flight(backends, key, prompt, context, flight, prediction))
+        flight.subscribers += 1
+        try:
+            async for chunk in flight.subscribe():
+                yield chunk
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                self._drop_flight(key, flight)
+                flight.task.cancel()
+        if usage is not None:
+            usage.update(flight.usage)
+            # Only the caller that started the completion accounts for its tokens
+            if not leader:
+                usage["coalesced"] = True
+
+    def _drop_flight(self, key: str, flight: StreamFlight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _wait_for_prefix(self, config: LLMConfig, context: Optional[str]) -> Optional[Tuple[str, asyncio.Event]]:
+        """
+        Requests sharing a context wait until the first of them has been
+        prefilled (its first token arrived), so they find the prefix in the
+        provider's cache instead of all computing it at once. Returns
+        (prefix key, event) when this request is the one warming the prefix.
+        """
+        if not context or LLM_PREFIX_WARMUP_WAIT <= 0:
+            return None
+        prefix_key = response_key(config.provider, config.model_name, SYSTEM_PROMPT, context)
+        loop = asyncio.get_running_loop()
+        entry = self._warming.get(prefix_key)
+        if entry is not None and entry[0] is loop:
+            try:
+                await asyncio.wait_for(entry[1].wait(), LLM_PREFIX_WARMUP_WAIT)
+            except asyncio.TimeoutError:
+                pass
+            return None
+        warmed = asyncio.Event()
+        self._warming[prefix_key] = (loop, warmed)
+        return prefix_key, warmed
+
+    def _prefix_warmed(self, warming: Optional[Tuple[str, asyncio.Event]]):
+        if warming is None or warming[1].is_set():
+            return
+        prefix_key, warmed = warming
+        warmed.set()
+        entry = self._warming.get(prefix_key)
+        if entry is not None and entry[1] is warmed:
+            del self._warming[prefix_key]
+
+    async def _run_flight(self, backends: List[LLMConfig], key: str, prompt: str, context: Optional[str], flight: StreamFlight,
+                          prediction: Optional[str] = None):
+        """
+        Streams the upstream completion into the flight, then caches it. Until
+        the first chunk arrives, failures are retried on the pool's backends.
+        """
+        # The active config identifies the pool for caching and prefix handling
+        config = backends[0]
+        warming = None
+        affinity = self._affinity_key(config, context)
+        tried = set()
+        error = None
+        queued = time.perf_counter()
+        first_token = None
+        try:
+            warming = await self._wait_for_prefix(config, context)
+            options = {"stream_options": {"include_usage": True}} if LLM_STREAM_USAGE else {}
+            for attempt in range(LLM_MAX_ATTEMPTS):
+                if tried and len(tried) >= len(backends):
+                    await asyncio.sleep(self.router.backoff(attempt - 1, error))
+                backend = self.router.acquire(backends, tried, affinity)
+                started = time.perf_counter()
+                try:
+                    async with self.limiter(backend):
+                        sent = time.perf_counter()
+                        stream = await self._get_async_client(backend).chat.completions.create(
+                            model=backend.model_name,
+                            messages=self._messages(prompt, context),
+                            temperature=0.0,
+                            stream=True,
+                            **options,
+                            **self._prediction_options(backend, prediction)
+                        )
+                        try:
+                            async for chunk in stream:
+                                if chunk.usage is not None:
+                                    flight.usage = extract_usage(chunk.usage)
+                                if chunk.choices and chunk.choices[0].delta.content:
+                                    if first_token is None:
+                                        first_token = time.perf_counter()
+                                    self._prefix_warmed(warming)
+                                    flight.publish(chunk.choices[0].delta.content)
+                        finally:
+                            # Also reached on cancellation; stops the provider from generating further
+                            await stream.close()
+                except Exception as e:
+                    self.router.release(backend, error=e)
+                    # Once chunks went out, another backend can't take over
+                    if flight.chunks or not is_retryable(e) or attempt == LLM_MAX_ATTEMPTS - 1:
+                        raise
+                    print(f"LLM backend {backend.name} failed ({e}), retrying")
+                    tried.add(backend.id)
+                    error = e
+                    continue
+                except BaseException:
+                    self.router.release(backend, cancelled=True)
+                    raise
+                finished = time.perf_counter()
+                self.router.release(backend, latency=finished - started)
+                flight.usage.update(call_metrics(queued, sent, first_token, finished,
+                                                 flight.usage.get("completion_tokens", 0)))
+                self.router.observe(backend, flight.usage)
+                flight.usage["backend"] = backend.name
+                break
+        except asyncio.CancelledError:
+            self._drop_flight(key, flight)
+            flight.publish(error=Exception("cancelled"))
+            raise
+        except Exception as e:
+            self._drop_flight(key, flight)
+            flight.publish(error=e)
+            return
+        finally:
+            self._prefix_warmed(warming)
+
+        flight.publish(done=True)
+        # Requests arriving while the response is stored still join this flight
+        try:
+            await asyncio.to_thread(self._store, config, key, prompt, "".join(flight.chunks))
+        finally:
+            self._drop_flight(key, flight)
+
 llm_service = LLMService()
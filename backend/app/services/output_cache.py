@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+OUTPUT_CACHE_MAX_BYTES = int(os.getenv("OMNIGEN_OUTPUT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Larger outputs are rendered every time instead of evicting the rest of the cache
+OUTPUT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("OMNIGEN_OUTPUT_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+
+def schema_hash(context: Dict[str, Any]) -> str:
+    """Stable hash of a render context (table schema plus TableName)."""
+    payload = json.dumps(context, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def output_key(template_hash: str, context_hash: str, filter_version: str) -> str:
+    return hashlib.sha256(f"{template_hash}:{context_hash}:{filter_version}".encode("utf-8")).hexdigest()
+
+class OutputCache:
+    """
+    Content-addressed LRU of rendered Jinja outputs, keyed by
+    (template content hash, schema hash, filter version) and bounded by the
+    total size (in characters) of the cached outputs.
+    """
+    def __init__(self, max_bytes: int = OUTPUT_CACHE_MAX_BYTES, max_entry_bytes: int = OUTPUT_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            code = self._entries.get(key)
+            if code is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return code
+
+    def put(self, key: str, code: str):
+        size = len(code)
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = code
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
@@ -0,0 +1,247 @@
+import importlib.util
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Default prompt token budget for a table schema when the LLM config sets none (0 = unlimited)
+SCHEMA_TOKEN_BUDGET = int(os.getenv("OMNIGEN_SCHEMA_TOKEN_BUDGET", "0"))
+# Rough size of a token when tiktoken isn't installed
+CHARS_PER_TOKEN = 4
+# Columns named like attr1..attrN with the same definition are listed as one family from this size on
+FAMILY_MIN_SIZE = 3
+# Comments repeated on at least this many columns are written once as a note
+NOTE_MIN_REPEATS = 2
+# Column names listed per line once the budget only leaves room for names
+NAMES_PER_LINE = 20
+TRUNCATION_NOTE = "(schema truncated to fit the token budget)"
+
+SCHEMA_FORMATS = ("full", "compact")
+
+# Exact token counts need the optional tiktoken package (pip install tiktoken)
+TIKTOKEN_AVAILABLE = importlib.util.find_spec("tiktoken") is not None
+_encoding = None
+
+TYPE_ABBREVIATIONS = [
+    (re.compile(r"^character varying"), "vc"),
+    (re.compile(r"^varchar"), "vc"),
+    (re.compile(r"^nvarchar"), "nvc"),
+    (re.compile(r"^integer"), "int"),
+    (re.compile(r"^datetime"), "dt"),
+    (re.compile(r"^timestamp"), "ts"),
+    (re.compile(r"^decimal"), "dec"),
+    (re.compile(r"^numeric"), "num"),
+    (re.compile(r"^boolean"), "bool"),
+    (re.compile(r"^double precision"), "double"),
+]
+TYPE_LEGEND = {"vc": "varchar", "nvc": "nvarchar", "dt": "datetime", "ts": "timestamp", "dec": "decimal", "num": "numeric"}
+# Collation and charset clauses say nothing about the code to generate
+TYPE_NOISE = re.compile(r"\s+(COLLATE|CHARACTER SET|CHARSET)\s+\S+", re.IGNORECASE)
+FAMILY_NAME = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens of text: exact with tiktoken, otherwise estimated from its length."""
+    global _encoding
+    if TIKTOKEN_AVAILABLE:
+        try:
+            if _encoding is None:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            return len(_encoding.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def format_schema_full(schema: Dict[str, Any]) -> str:
+    """Formats table schema into a readable string for LLM, one line per column."""
+    table_name = schema.get("table_name") or schema.get("TableName") or "Unknown"
+    comment = schema.get("comment", "")
+    columns = schema.get("columns", [])
+
+    lines = []
+    lines.append(f"Table Name: {table_name}")
+    if comment:
+        lines.append(f"Table Comment: {comment}")
+    lines.append("Columns:")
+
+    for col in columns:
+        c_name = col['name']
+        c_type = col['type']
+        c_pk = " (PK)" if col.get('primary_key') else ""
+        c_comment = f" - {col['comment']}" if col.get('comment') else ""
+        lines.append(f"- {c_name} ({c_type}){c_pk}{c_comment}")
+
+    return "\n".join(lines)
+
+def abbreviate_type(sql_type: Any) -> str:
+    """VARCHAR(255) COLLATE "utf8mb4_bin" -> vc(255)"""
+    text = TYPE_NOISE.sub("", str(sql_type or "")).strip().lower()
+    text = re.sub(r"\s*,\s*", ",", text)
+    for pattern, short in TYPE_ABBREVIATIONS:
+        text = pattern.sub(short, text)
+    return text.replace(" ", "_")
+
+def redundant_comment(name: str, comment: str) -> bool:
+    """A comment that only repeats the column name (user_name: "User name") adds nothing."""
+    return re.sub(r"[\W_]+", "", comment).lower() == re.sub(r"[\W_]+", "", name).lower()
+
+def zero_padded(number: str) -> bool:
+    return len(number) > 1 and number.startswith("0")
+
+def same_padding(first: str, number: str) -> bool:
+    """Whether number can follow first in a run: both unpadded, or padded to the same width."""
+    if zero_padded(first):
+        return len(number) == len(first)
+    return not zero_padded(number)
+
+def compact_entries(columns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Compact column entries: abbreviated types, redundant comments dropped and
+    runs of numbered columns with the same definition (attr1, attr2, ...)
+    merged into one entry, where {n} stands for the number in the comment.
+    Zero padded numbers (col01, col02, ...) keep their width. Column order is kept.
+    """
+    entries = []
+    run: List[Dict[str, Any]] = []
+
+    def flush():
+        if len(run) >= FAMILY_MIN_SIZE:
+            first, last = run[0], run[-1]
+            prefix, suffix = first["family"][0], first["family"][1]
+            entries.append({"name": f"{prefix}{{{first['number']}..{last['number']}}}{suffix}", "type": first["type"],
+                            "pk": False, "comment": first["family"][3]})
+        else:
+            entries.extend(run)
+        run.clear()
+
+    for col in columns:
+        name = col["name"]
+        comment = (col.get("comment") or "").strip()
+        if comment and redundant_comment(name, comment):
+            comment = ""
+        entry = {"name": name, "type": abbreviate_type(col.get("type")), "pk": bool(col.get("primary_key")), "comment": comment}
+        match = FAMILY_NAME.match(name) if not entry["pk"] else None
+        if match is None:
+            flush()
+            entries.append(entry)
+            continue
+        prefix, number, suffix = match.groups()
+        shared_comment = re.sub(rf"(?<!\d){number}(?!\d)", "{n}", comment, count=1)
+        entry["family"] = (prefix, suffix, entry["type"], shared_comment)
+        entry["number"] = number
+        # A run continues with the next number of the same family, written with
+        # the same width if the run's numbers are zero padded
+        if run and (run[-1]["family"] != entry["family"] or int(run[-1]["number"]) + 1 != int(number)
+                    or not same_padding(run[0]["number"], number)):
+            flush()
+        run.append(entry)
+    flush()
+    return entries
+
+def format_schema_compact(schema: Dict[str, Any], comments: bool = True, max_entries: Optional[int] = None) -> str:
+    """
+    Compact encoding of a table schema. Comments used by several columns are
+    written once as notes. With max_entries only that many columns keep their
+    definition (primary keys first); the rest are listed by name.
+    """
+    table_name = schema.get("table_name") or schema.get("TableName") or "Unknown"
+    entries = compact_entries(schema.get("columns", []))
+    if max_entries is not None and max_entries < len(entries):
+        ranked = sorted(range(len(entries)), key=lambda i: (not entries[i]["pk"], i))
+        kept = set(ranked[:max_entries])
+        detailed = [e for i, e in enumerate(entries) if i in kept]
+        names_only = [e["name"] for i, e in enumerate(entries) if i not in kept]
+    else:
+        detailed, names_only = entries, []
+
+    notes: Dict[str, int] = {}
+    if comments:
+        repeats: Dict[str, int] = {}
+        for e in detailed:
+            if e["comment"]:
+                repeats[e["comment"]] = repeats.get(e["comment"], 0) + 1
+        for comment, count in repeats.items():
+            if count >= NOTE_MIN_REPEATS and len(comment) > 8:
+                notes[comment] = len(notes) + 1
+
+    lines = [f"Table: {table_name}" + (f" -- {schema['comment']}" if schema.get("comment") else "")]
+    legend = sorted({short for e in detailed for short in TYPE_LEGEND if re.match(rf"{short}\b", e["type"])})
+    header = "Columns (name type, PK = primary key"
+    if legend:
+        header += ", " + ", ".join(f"{short}={TYPE_LEGEND[short]}" for short in legend)
+    if any("{n}" in e["comment"] for e in detailed) or any("{" in e["name"] for e in detailed):
+        header += ", {a..b} = numbered columns"
+    lines.append(header + "):")
+    for e in detailed:
+        line = f"{e['name']} {e['type']}" + (" PK" if e["pk"] else "")
+        if comments and e["comment"]:
+            line += f" # [{notes[e['comment']]}]" if e["comment"] in notes else f" # {e['comment']}"
+        lines.append(line)
+    if names_only:
+        lines.append(f"More columns ({len(names_only)}, definitions omitted):")
+        for i in range(0, len(names_only), NAMES_PER_LINE):
+            lines.append(", ".join(names_only[i:i + NAMES_PER_LINE]))
+    if notes:
+        lines.append("Notes:")
+        lines += [f"[{n}] {comment}" for comment, n in notes.items()]
+    return "\n".join(lines)
+
+def format_schema(schema: Dict[str, Any], schema_format: str = "full", budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Serializes a schema for a prompt, compacting it as far as needed to stay
+    within budget tokens: the full listing (unless schema_format is
+    "compact"), the compact encoding, the compact encoding without column
+    comments, then fewer column definitions. Returns (text, report) where
+    the report holds the schema's tokens and the tokens saved against the
+    full listing. A budget too small for even the table's column names gets
+    the smallest complete encoding, reported as "over_budget" with the
+    tokens it exceeds the budget by.
+    """
+    full = format_schema_full(schema)
+    full_tokens = count_tokens(full)
+    budget = budget or None
+
+    def report(text: str, level: str) -> Tuple[str, Dict[str, Any]]:
+        tokens = full_tokens if text is full else count_tokens(text)
+        return text, {"schema_format": level, "schema_tokens": tokens, "schema_tokens_saved": full_tokens - tokens}
+
+    fits = budget is None or full_tokens <= budget
+    if schema_format != "compact" and fits:
+        return report(full, "full")
+    text = format_schema_compact(schema)
+    tokens = count_tokens(text)
+    # The compact header doesn't pay off for small tables
+    if fits and tokens >= full_tokens:
+        return report(full, "full")
+    if budget is None or tokens <= budget:
+        return report(text, "compact")
+    smallest = min((full, text), key=count_tokens)
+    text = format_schema_compact(schema, comments=False)
+    if count_tokens(text) <= budget:
+        return report(text, "compact_no_comments")
+    smallest = min((smallest, text), key=count_tokens)
+
+    # Keep as many column definitions as fit (primary keys first)
+    low, high = 0, len(compact_entries(schema.get("columns", [])))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(format_schema_compact(schema, comments=False, max_entries=middle)) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    text = format_schema_compact(schema, comments=False, max_entries=low)
+    if count_tokens(text) > budget:
+        # Not even the names fit; keep the lines that do and say so
+        lines = text.split("\n")
+        kept = [lines[0]]
+        for line in lines[1:]:
+            if count_tokens("\n".join(kept + [line, TRUNCATION_NOTE])) > budget:
+                break
+            kept.append(line)
+        text = "\n".join(kept + [TRUNCATION_NOTE])
+        if count_tokens(text) > budget:
+            # A cut down schema that still doesn't fit is no use; send all of it
+            text, info = report(smallest, "over_budget")
+            info["schema_over_budget"] = info["schema_tokens"] - budget
+            return text, info
+    return report(text, "truncated")
@@ -0,0 +1,119 @@
+import json
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.models import DatabaseConfig, SchemaSnapshot
+from app.services.db_service import normalize_db_url
+from app.services.output_cache import schema_hash
+
+class SnapshotService:
+    """
+    Persists the last generated schema of every table per DatabaseConfig, so
+    incremental runs only regenerate tables whose definition changed.
+    """
+    def __init__(self):
+        pass
+
+    def find_database_config(self, db: Session, db_url: str) -> Optional[DatabaseConfig]:
+        """Returns the saved data source whose URL matches db_url."""
+        target = normalize_db_url(db_url)
+        for config in db.query(DatabaseConfig).all():
+            if config.url and normalize_db_url(config.url) == target:
+                return config
+        return None
+
+    def resolve_config_id(self, db: Session, db_url: str, datasource_id: Optional[int] = None) -> Optional[int]:
+        """Returns the DatabaseConfig id snapshots are stored under, if the source is a saved one."""
+        if datasource_id is not None:
+            config = db.query(DatabaseConfig).filter(DatabaseConfig.id == datasource_id).first()
+            if not config:
+                raise Exception("DatabaseConfig not found")
+            return config.id
+        config = self.find_database_config(db, db_url)
+        return config.id if config else None
+
+    def select_tables(self, db: Session, db_url: str, selected_tables: List[str], schemas: Dict[str, Dict[str, Any]],
+                      datasource_id: Optional[int] = None, incremental: bool = False):
+        """
+        Diffs the live schemas against the snapshots of the run's data source.
+        Returns (tables to generate, per-table schema changes, DatabaseConfig id).
+        Incremental runs leave out tables whose schema is unchanged.
+        """
+        selected = list(dict.fromkeys(selected_tables))
+        config_id = self.resolve_config_id(db, db_url, datasource_id)
+        if config_id is None:
+            if incremental:
+                raise Exception("Incremental generation requires a saved data source (datasource_id)")
+            return selected, {}, None
+        changes = self.diff(db, config_id, schemas)
+        if incremental:
+            selected = [t for t in selected if changes[t]["status"] != "unchanged"]
+        return selected, changes, config_id
+
+    def get_snapshots(self, db: Session, config_id: int, table_names: List[str]) -> Dict[str, SchemaSnapshot]:
+        snapshots = (
+            db.query(SchemaSnapshot)
+            .filter(SchemaSnapshot.database_config_id == config_id, SchemaSnapshot.table_name.in_(table_names))
+            .all()
+        )
+        return {s.table_name: s for s in snapshots}
+
+    def diff(self, db: Session, config_id: int, schemas: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Compares live schemas against the stored snapshots. Returns, per table,
+        a status ("new", "changed" or "unchanged") and a list of changes.
+        """
+        snapshots = self.get_snapshots(db, config_id, list(schemas.keys()))
+        result = {}
+        for table_name, schema in schemas.items():
+            snapshot = snapshots.get(table_name)
+            if snapshot is None:
+                result[table_name] = {"status": "new", "changes": []}
+            elif snapshot.schema_hash == schema_hash(schema):
+                result[table_name] = {"status": "unchanged", "changes": []}
+            else:
+                changes = describe_schema_changes(json.loads(snapshot.schema_json), schema)
+                result[table_name] = {"status": "changed", "changes": changes}
+        return result
+
+    def save(self, db: Session, config_id: int, schemas: Dict[str, Dict[str, Any]]):
+        """Inserts or updates the snapshots of the given tables."""
+        if not schemas:
+            return
+        snapshots = self.get_snapshots(db, config_id, list(schemas.keys()))
+        for table_name, schema in schemas.items():
+            snapshot = snapshots.get(table_name)
+            if snapshot is None:
+                snapshot = SchemaSnapshot(database_config_id=config_id, table_name=table_name)
+                db.add(snapshot)
+            snapshot.schema_hash = schema_hash(schema)
+            snapshot.schema_json = json.dumps(schema, default=str)
+        db.commit()
+
+    def delete_for_config(self, db: Session, config_id: int):
+        db.query(SchemaSnapshot).filter(SchemaSnapshot.database_config_id == config_id).delete()
+
+def describe_schema_changes(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Human readable differences between two schemas (columns, types, PKs, comments)."""
+    changes = []
+    if old.get("comment") != new.get("comment"):
+        changes.append("table comment changed")
+    old_cols = {c["name"]: c for c in old.get("columns", [])}
+    new_cols = {c["name"]: c for c in new.get("columns", [])}
+    for name in new_cols:
+        if name not in old_cols:
+            changes.append(f"column {name} added")
+    for name in old_cols:
+        if name not in new_cols:
+            changes.append(f"column {name} removed")
+    for name, col in new_cols.items():
+        before = old_cols.get(name)
+        if before is None:
+            continue
+        for field in ("type", "nullable", "default", "primary_key", "comment"):
+            if before.get(field) != col.get(field):
+                changes.append(f"column {name} {field} changed: {before.get(field)} -> {col.get(field)}")
+    if not changes and [c["name"] for c in old.get("columns", [])] != list(new_cols):
+        changes.append("column order changed")
+    return changes
+
+snapshot_service = SnapshotService()
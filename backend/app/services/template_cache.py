@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from jinja2 import Environment, FileSystemBytecodeCache, Template as JinjaTemplate, TemplateSyntaxError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+TEMPLATE_CACHE_MAX_SIZE = int(os.getenv("OMNIGEN_TEMPLATE_CACHE_MAX_SIZE", "1000"))
+# Optional directory for the on-disk bytecode cache shared by all workers
+TEMPLATE_BYTECODE_DIR = os.getenv("OMNIGEN_TEMPLATE_BYTECODE_DIR", "")
+
+def content_hash(source: Optional[str]) -> str:
+    return hashlib.sha1((source or "").encode("utf-8")).hexdigest()
+
+class TemplateCache:
+    """
+    Process-wide LRU of compiled Jinja templates, keyed by (template id, kind)
+    where kind is "content" or "prompt". An entry is only reused while the
+    template's updated_at and source hash match, so edits are picked up even
+    without explicit invalidation.
+    """
+    def __init__(self, filters: Dict[str, Callable], max_size: int = TEMPLATE_CACHE_MAX_SIZE,
+                 bytecode_dir: str = TEMPLATE_BYTECODE_DIR):
+        self.max_size = max_size
+        self.env = Environment(bytecode_cache=self._make_bytecode_cache(bytecode_dir))
+        self.env.filters.update(filters)
+        self._entries: "OrderedDict[Tuple[Any, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, template_id: Any, kind: str, source: Optional[str],
+            updated_at: Optional[datetime] = None) -> JinjaTemplate:
+        """Returns the compiled template, compiling it on a miss."""
+        key = (template_id, kind)
+        version = (updated_at, content_hash(source))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["version"] == version:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry["template"]
+            self._stats["misses"] += 1
+
+        # Compile outside of the lock; a concurrent miss just compiles twice
+        compiled = self._compile(source or "")
+
+        with self._lock:
+            self._entries[key] = {"version": version, "template": compiled}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return compiled
+
+    def _make_bytecode_cache(self, bytecode_dir: str) -> Optional[FileSystemBytecodeCache]:
+        if not bytecode_dir:
+            return None
+        try:
+            os.makedirs(bytecode_dir, exist_ok=True)
+        except OSError as e:
+            print(f"Template bytecode cache disabled, cannot use {bytecode_dir}: {e}")
+            return None
+        return FileSystemBytecodeCache(bytecode_dir, "omnigen-%s.cache")
+
+    def _compile(self, source: str) -> JinjaTemplate:
+        """
+        Compiles a template source. With a bytecode cache configured, the
+        compiled code is looked up by content hash first, so a fresh worker
+        skips parsing for any template another worker already compiled.
+        This mirrors what jinja2's BaseLoader.load does for named templates.
+        """
+        bcc = self.env.bytecode_cache
+        if bcc is None:
+            return self.env.from_string(source)
+        name = content_hash(source)
+        bucket = bcc.get_bucket(self.env, name, None, source)
+        code = bucket.code
+        if code is None:
+            code = self.env.compile(source, name)
+            bucket.code = code
+            bcc.set_bucket(bucket)
+        return self.env.template_class.from_code(self.env, code, self.env.make_globals(None))
+
+    def invalidate(self, template_id: Optional[Any] = None) -> int:
+        """Drops every compiled kind of a template, or everything without an id."""
+        with self._lock:
+            if template_id is None:
+                keys = list(self._entries.keys())
+            else:
+                keys = [key for key in self._entries if key[0] == template_id]
+            for key in keys:
+                del self._entries[key]
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "bytecode_cache": self.env.bytecode_cache.directory if self.env.bytecode_cache else None,
+            }
+
+class PathRenderer:
+    """
+    Shared engine for output path patterns (root_path/relative_path). Every
+    distinct pattern is compiled once; a pattern with a syntax error is
+    reported once and then rendered verbatim.
+    """
+    def __init__(self, filters: Dict[str, Callable]):
+        self.env = Environment()
+        self.env.filters.update(filters)
+        self._compiled: Dict[str, Tuple[Optional[JinjaTemplate], Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, pattern: str) -> Tuple[Optional[JinjaTemplate], Optional[str]]:
+        """Returns (compiled template, None) or (None, syntax error message)."""
+        with self._lock:
+            cached = self._compiled.get(pattern)
+        if cached is not None:
+            return cached
+        try:
+            result = (self.env.from_string(pattern), None)
+        except TemplateSyntaxError as e:
+            result = (None, f"Invalid path template '{pattern}': {e.message} (line {e.lineno})")
+            print(result[1])
+        with self._lock:
+            self._compiled[pattern] = result
+        return result
+
+    def render(self, pattern: Optional[str], context: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """Returns (rendered path, error message or None)."""
+        if not pattern:
+            return "", None
+        # Static patterns skip Jinja entirely
+        if "{" not in pattern:
+            return pattern, None
+        compiled, error = self.compile(pattern)
+        if compiled is None:
+            return pattern, error
+        try:
+            return compiled.render(context), None
+        except Exception as e:
+            return pattern, f"Failed to render path template '{pattern}': {e}"
@@ -0,0 +1,49 @@
+from app.services.generator_service import BATCH_END_MARKER, parse_batch_response
+
+LABELS = ["user/User.java", "user/UserMapper.java"]
+
+def batch(*files):
+    return "\n\n".join(f"=== FILE: {label} ===\n{code}\n{BATCH_END_MARKER}" for label, code in files)
+
+def test_splits_files_by_label():
+    text = batch(("user/User.java", "class User {}"), ("user/UserMapper.java", "interface UserMapper {}"))
+    assert parse_batch_response(text, LABELS) == {
+        "user/User.java": "class User {}",
+        "user/UserMapper.java": "interface UserMapper {}",
+    }
+
+def test_strips_code_fences():
+    text = batch(("user/User.java", "```java\nclass User {}\n```"))
+    assert parse_batch_response(text, LABELS) == {"user/User.java": "class User {}"}
+
+def test_file_without_end_marker_runs_to_next_file():
+    text = "=== FILE: user/User.java ===\nclass User {}\n=== FILE: user/UserMapper.java ===\ninterface UserMapper {}"
+    assert parse_batch_response(text, LABELS) == {
+        "user/User.java": "class User {}",
+        "user/UserMapper.java": "interface UserMapper {}",
+    }
+
+def test_missing_files_are_left_out():
+    text = batch(("user/UserMapper.java", "interface UserMapper {}"))
+    assert parse_batch_response(text, LABELS) == {"user/UserMapper.java": "interface UserMapper {}"}
+
+def test_unknown_empty_and_repeated_files_are_ignored():
+    text = batch(
+        ("user/Other.java", "class Other {}"),
+        ("user/UserMapper.java", ""),
+        ("user/User.java", "class User {}"),
+        ("user/User.java", "class Duplicate {}"),
+    )
+    assert parse_batch_response(text, LABELS) == {"user/User.java": "class User {}"}
+
+def test_text_after_end_marker_is_dropped():
+    text = batch(("user/User.java", "class User {}")) + "\nThat's all the files."
+    assert parse_batch_response(text, LABELS) == {"user/User.java": "class User {}"}
+
+def test_headings_must_start_a_line():
+    text = "class User { String s = \"=== FILE: user/UserMapper.java ===\"; }"
+    assert parse_batch_response(text, LABELS) == {}
+
+def test_empty_response():
+    assert parse_batch_response("", LABELS) == {}
+    assert parse_batch_response(None, LABELS) == {}
@@ -0,0 +1,78 @@
+from app.services.schema_prompt import compact_entries, count_tokens, format_schema, format_schema_full
+
+def column(name, type_="VARCHAR(20)", comment="", primary_key=False):
+    return {"name": name, "type": type_, "comment": comment, "primary_key": primary_key}
+
+def schema(columns, comment=""):
+    return {"table_name": "orders", "comment": comment, "columns": columns}
+
+def names(columns):
+    return [e["name"] for e in compact_entries(columns)]
+
+def wide_schema():
+    columns = [column("id", "INTEGER", primary_key=True)]
+    columns += [column(f"field_{chr(97 + i)}_name", "VARCHAR(255)", f"Description of field {i} in detail") for i in range(20)]
+    return schema(columns, "Customer orders")
+
+def test_numbered_columns_merge_into_a_family():
+    columns = [column(f"attr{i}", comment=f"Attribute {i}") for i in range(1, 6)]
+    assert compact_entries(columns) == [{"name": "attr{1..5}", "type": "vc(20)", "pk": False, "comment": "Attribute {n}"}]
+
+def test_zero_padded_numbers_keep_their_width():
+    assert names([column(f"col{i:02d}") for i in range(1, 12)]) == ["col{01..11}"]
+    assert names([column(f"c{i:03d}_x") for i in range(8, 12)]) == ["c{008..011}_x"]
+
+def test_padded_and_unpadded_numbers_are_separate_runs():
+    columns = [column(f"col{i:02d}") for i in range(7, 10)] + [column(f"col{i}") for i in range(10, 13)]
+    assert names(columns) == ["col{07..12}"]
+    columns = [column(f"col{i:03d}") for i in range(7, 10)] + [column(f"col{i}") for i in range(10, 13)]
+    assert names(columns) == ["col{007..009}", "col{10..12}"]
+    columns = [column(f"col{i}") for i in range(7, 10)] + [column("col010"), column("col011")]
+    assert names(columns) == ["col{7..9}", "col010", "col011"]
+
+def test_short_or_broken_runs_stay_separate():
+    assert names([column("a1"), column("a2")]) == ["a1", "a2"]
+    assert names([column("a1"), column("a2"), column("a4")]) == ["a1", "a2", "a4"]
+    columns = [column("a1"), column("a2"), column("a3", "INTEGER")]
+    assert names(columns) == ["a1", "a2", "a3"]
+
+def test_primary_keys_are_not_merged():
+    columns = [column(f"key{i}", primary_key=True) for i in range(1, 4)]
+    assert names(columns) == ["key1", "key2", "key3"]
+
+def test_redundant_comments_are_dropped():
+    entries = compact_entries([column("user_name", comment="User name"), column("age", "INTEGER", "Age in years")])
+    assert [e["comment"] for e in entries] == ["", "Age in years"]
+
+def test_without_budget_full_listing_is_kept():
+    s = wide_schema()
+    text, report = format_schema(s)
+    assert text == format_schema_full(s)
+    assert report == {"schema_format": "full", "schema_tokens": count_tokens(text), "schema_tokens_saved": 0}
+
+def test_compact_format_saves_tokens():
+    text, report = format_schema(wide_schema(), "compact")
+    assert report["schema_format"] == "compact"
+    assert report["schema_tokens"] == count_tokens(text)
+    assert report["schema_tokens_saved"] > 0
+
+def test_budget_steps_down_and_is_respected():
+    s = wide_schema()
+    full_tokens = count_tokens(format_schema_full(s))
+    previous = None
+    for budget in (full_tokens, full_tokens - 1, full_tokens // 2, full_tokens // 4, 40):
+        text, report = format_schema(s, "full", budget)
+        assert report["schema_tokens"] == count_tokens(text) <= budget
+        assert report["schema_tokens_saved"] >= 0
+        assert previous is None or report["schema_tokens"] <= previous
+        previous = report["schema_tokens"]
+    assert format_schema(s, "full", full_tokens)[1]["schema_format"] == "full"
+    assert format_schema(s, "full", 40)[1]["schema_format"] == "truncated"
+
+def test_budget_below_any_schema_reports_the_overflow():
+    s = wide_schema()
+    text, report = format_schema(s, "full", 1)
+    assert report["schema_format"] == "over_budget"
+    assert "truncated" not in text
+    assert report["schema_over_budget"] == report["schema_tokens"] - 1 > 0
+    assert report["schema_tokens_saved"] >= 0
@@ -0,0 +1,47 @@
+import os
+import stat
+from app.services.generator_service import StreamingFileWriter
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+def test_commit_replaces_target(tmp_path):
+    target = str(tmp_path / "out" / "User.java")
+    writer = StreamingFileWriter(target)
+    writer.write("class User {}")
+    assert writer.commit() == "written"
+    assert read(target) == "class User {}"
+    assert os.listdir(tmp_path / "out") == ["User.java"]
+    assert stat.S_IMODE(os.stat(target).st_mode) & 0o444
+
+def test_identical_content_is_unchanged(tmp_path):
+    target = str(tmp_path / "User.java")
+    for expected in ("written", "unchanged"):
+        writer = StreamingFileWriter(target)
+        writer.write("class User {}")
+        assert writer.commit() == expected
+
+def test_concurrent_writers_of_one_target(tmp_path):
+    target = str(tmp_path / "User.java")
+    first, second = StreamingFileWriter(target), StreamingFileWriter(target)
+    assert first.tmp_path != second.tmp_path
+    first.write("first A content\n")
+    second.write("BB\n")
+    first.write("more A\n")
+    second.write("B tail\n")
+    assert first.commit() == "written"
+    assert read(target) == "first A content\nmore A\n"
+    assert second.commit() == "written"
+    assert read(target) == "BB\nB tail\n"
+    assert os.listdir(tmp_path) == ["User.java"]
+
+def test_abort_leaves_other_writers_alone(tmp_path):
+    target = str(tmp_path / "User.java")
+    first, second = StreamingFileWriter(target), StreamingFileWriter(target)
+    first.write("abandoned")
+    second.write("kept")
+    first.abort()
+    assert second.commit() == "written"
+    assert read(target) == "kept"
+    assert os.listdir(tmp_path) == ["User.java"]